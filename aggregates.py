@@ -0,0 +1,269 @@
+import threading
+from array import array
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# ==================================================
+# MATERIALIZED QUANTITY AGGREGATES
+# ==================================================
+# Quantity totals per (item_id, location), (model, location) and
+# (model, item_id, location), folded in as rows are
+# tailed so the summary panels read precomputed numbers instead of
+# rescanning the log. Covers the whole log, i.e. no date filter.
+#
+# Big batches (the cold load, archive partitions) are grouped with pandas
+# and merged into the three base tables in one groupby on the next lookup.
+# Small increments (new scans) are folded into dicts on top of them; the
+# snapshot starts a fresh instance on every rebuild, so those stay small.
+GROUP_KEYS = ["model", "item_id", "location"]
+
+
+def _group(df):
+    return df.groupby(GROUP_KEYS, dropna=False, sort=False, observed=True).agg(
+        qty=("status", "sum")
+    )
+
+
+def _regroup(table, levels):
+    return table.groupby(level=levels, dropna=False, sort=False, observed=True).agg(
+        qty=("qty", "sum")
+    )
+
+
+class QuantityAggregates:
+    # Increments with more groups than this are merged as tables
+    DICT_FOLD_MAX = 5_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # Base tables indexed by their key columns: qty
+            self._model_item_table = None
+            self._item_table = None
+            self._model_table = None
+            self._pending = []
+
+            # Increments since: key -> quantity
+            self.by_item = {}
+            self.by_model = {}
+            self.by_model_item = {}
+            # model -> {item_id}
+            self.model_items = defaultdict(set)
+
+    @staticmethod
+    def _fold(table, key, qty):
+        table[key] = table.get(key, 0) + qty
+
+    def add(self, df):
+        # df: parsed rows (numeric status, datetime timestamp)
+        if df.empty:
+            return
+
+        grouped = _group(df)
+
+        with self._lock:
+            if len(grouped) > self.DICT_FOLD_MAX:
+                self._pending.append(grouped)
+                return
+
+            for (model, item_id, location), qty in zip(grouped.index, grouped["qty"]):
+                self._fold(self.by_item, (item_id, location), qty)
+                self._fold(self.by_model, (model, location), qty)
+                self._fold(self.by_model_item, (model, item_id, location), qty)
+                self.model_items[model].add(item_id)
+
+    def _settle(self):
+        # Caller holds the lock. Merges the pending batches into the base
+        # tables.
+        if not self._pending:
+            return
+
+        tables = self._pending
+        if self._model_item_table is not None:
+            tables = [self._model_item_table] + tables
+        model_item = tables[0] if len(tables) == 1 else _regroup(pd.concat(tables), [0, 1, 2])
+
+        self._model_item_table = model_item
+        self._item_table = _regroup(model_item, ["item_id", "location"])
+        self._model_table = _regroup(model_item, ["model", "location"])
+        self._pending = []
+
+    @staticmethod
+    def _quantity(table, increments, key):
+        qty = increments.get(key, 0)
+        if table is not None:
+            qty += table["qty"].get(key, 0)
+        return int(qty)
+
+    # ---------- lookups ----------
+    def item_quantities(self, item_id, locations):
+        with self._lock:
+            self._settle()
+            return {
+                loc: self._quantity(self._item_table, self.by_item, (item_id, loc))
+                for loc in locations
+            }
+
+    def model_quantities(self, model, locations):
+        with self._lock:
+            self._settle()
+            return {
+                loc: self._quantity(self._model_table, self.by_model, (model, loc))
+                for loc in locations
+            }
+
+    def model_item_matrix(self, model, locations):
+        # item_id x location quantities for every item logged under model,
+        # the same shape as quantity_matrix()
+        with self._lock:
+            self._settle()
+
+            matrix = pd.DataFrame(
+                0, index=pd.Index([], name="item_id"), columns=locations
+            )
+            table = self._model_item_table
+            if table is not None and model in table.index.levels[0]:
+                # Compare level codes rather than materialising the labels
+                code = table.index.levels[0].get_loc(model)
+                rows = table["qty"][table.index.codes[0] == code]
+                if len(rows):
+                    matrix = (
+                        rows.droplevel("model")
+                        .unstack("location", fill_value=0)
+                        .reindex(columns=locations, fill_value=0)
+                    )
+
+            items = self.model_items.get(model, ())
+            if items:
+                increments = pd.DataFrame.from_dict(
+                    {
+                        item_id: {
+                            loc: self.by_model_item.get((model, item_id, loc), 0)
+                            for loc in locations
+                        }
+                        for item_id in items
+                    },
+                    orient="index",
+                )
+                matrix = matrix.add(increments, fill_value=0)
+
+        matrix = matrix.sort_index().astype(int)
+        matrix.columns.name = None
+        return matrix
+
+
+# ==================================================
+# STAGE FLOW (DWELL TIME + WIP)
+# ==================================================
+# Where each item is now and since when, folded in row by row in log
+# order. When an item moves on, the time it spent at its previous stage is
+# recorded under that location (and under its model), so dwell times and
+# WIP come from state kept up to date per increment instead of a pass over
+# the full log. Repeated scans at the same location do not restart the
+# clock; rows older than the item's current stage entry are ignored.
+class FlowAggregates:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # item_id -> [location, entered_at (epoch s), model]
+        self.items = {}
+        # location -> item count currently there
+        self.wip = defaultdict(int)
+        # location / (location, model) -> dwell seconds
+        self.dwell_by_location = defaultdict(lambda: array("d"))
+        self.dwell_by_location_model = defaultdict(lambda: array("d"))
+
+    def add(self, df):
+        # df: parsed rows (datetime timestamp) in log order
+        if df.empty:
+            return
+
+        seconds = df["timestamp"].to_numpy(dtype="datetime64[s]").astype("int64")
+        missing = np.isnat(df["timestamp"].to_numpy())
+
+        with self._lock:
+            for item_id, location, model, ts, skip in zip(
+                df["item_id"].tolist(), df["location"].tolist(),
+                df["model"].tolist(), seconds.tolist(), missing.tolist(),
+            ):
+                if skip:
+                    continue
+                known_model = model if isinstance(model, str) and model != "-" else None
+
+                state = self.items.get(item_id)
+                if state is None:
+                    self.items[item_id] = [location, ts, known_model]
+                    self.wip[location] += 1
+                    continue
+
+                if known_model is not None:
+                    state[2] = known_model
+                if location == state[0] or ts < state[1]:
+                    continue
+
+                previous = state[0]
+                dwell = ts - state[1]
+                self.dwell_by_location[previous].append(dwell)
+                if state[2] is not None:
+                    self.dwell_by_location_model[(previous, state[2])].append(dwell)
+
+                self.wip[previous] -= 1
+                self.wip[location] += 1
+                state[0], state[1] = location, ts
+
+    # ---------- lookups ----------
+    def wip_counts(self, locations):
+        with self._lock:
+            return {loc: self.wip.get(loc, 0) for loc in locations}
+
+    def dwell_percentiles(self, locations, model=None, percentiles=(50, 90)):
+        # {location: {"count": n, 50: seconds, 90: seconds}}; None values
+        # where nothing has left that stage yet
+        with self._lock:
+            samples = {
+                loc: np.array(
+                    self.dwell_by_location.get(loc, ())
+                    if model is None
+                    else self.dwell_by_location_model.get((loc, model), ())
+                )
+                for loc in locations
+            }
+
+        result = {}
+        for loc, values in samples.items():
+            stats = {"count": len(values)}
+            for p in percentiles:
+                stats[p] = float(np.percentile(values, p)) if len(values) else None
+            result[loc] = stats
+        return result
+
+
+# ==================================================
+# AD-HOC QUANTITY MATRIX
+# ==================================================
+def quantity_matrix(df, locations):
+    # item_id x location quantity totals for an arbitrary (e.g. date-ranged)
+    # frame, computed in one pivot instead of one mask per location.
+    return (
+        df.pivot_table(
+            index="item_id",
+            columns="location",
+            values="status",
+            aggfunc="sum",
+            fill_value=0,
+            observed=True,
+        )
+        .reindex(columns=locations, fill_value=0)
+        .astype(int)
+    )
+
+
+def matrix_row(matrix, item_id=None):
+    # {location: quantity} for one item, or the column totals when item_id
+    # is None
+    totals = matrix.sum() if item_id is None else matrix.loc[item_id]
+    return {loc: int(qty) for loc, qty in totals.items()}
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import pandas as pd
+from filelock import FileLock
+
+from storage import DATA_DIR, CsvStorage, coerce_frame, concat_frames, get_storage
+
+# ==================================================
+# DAILY COLUMNAR ARCHIVE
+# ==================================================
+# Closed days are rolled out of trace_log.csv into one Parquet file per day
+# with typed/categorical columns, so date-ranged dashboard queries only load
+# the days they need and the live CSV stays small (normally just today).
+ARCHIVE_DIR = DATA_DIR / "archive"
+ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+
+PARTITION_PREFIX = "trace_"
+PARTITION_SUFFIX = ".parquet"
+
+CATEGORY_COLUMNS = ["location", "model", "substance"]
+
+# Written while a compaction is under way: the live log it read (inode and
+# row count) and the days whose partitions already hold that log's rows.
+# A run that died before swapping in the compacted log leaves it behind,
+# and the next run skips those rows instead of archiving them twice.
+COMPACT_JOURNAL = ARCHIVE_DIR / "compact.json"
+
+
+def partition_path(day):
+    return ARCHIVE_DIR / f"{PARTITION_PREFIX}{day.isoformat()}{PARTITION_SUFFIX}"
+
+
+def partition_days():
+    days = []
+    for path in ARCHIVE_DIR.glob(f"{PARTITION_PREFIX}*{PARTITION_SUFFIX}"):
+        stem = path.name[len(PARTITION_PREFIX): -len(PARTITION_SUFFIX)]
+        try:
+            days.append(date.fromisoformat(stem))
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+def to_columnar(df):
+    # Typed rows as the dashboard works with them, plus categoricals for
+    # the low-cardinality text columns
+    return df.assign(
+        item_id=df["item_id"].astype(str),
+        **{c: df[c].astype(str).astype("category") for c in CATEGORY_COLUMNS},
+    )
+
+
+def read_partition(day, columns=None, filters=None):
+    return pd.read_parquet(partition_path(day), columns=columns, filters=filters)
+
+# ==================================================
+# COMPACTION JOB
+# ==================================================
+def _read_journal(inode):
+    # Days already archived from the log with this inode, with its row count
+    try:
+        with open(COMPACT_JOURNAL, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return 0, set()
+    if journal.get("inode") != inode:
+        return 0, set()
+    return journal["rows"], {date.fromisoformat(day) for day in journal["days"]}
+
+
+def _write_journal(inode, rows, days):
+    tmp = COMPACT_JOURNAL.with_name(f"{COMPACT_JOURNAL.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {"inode": inode, "rows": rows, "days": sorted(d.isoformat() for d in days)},
+            f,
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, COMPACT_JOURNAL)
+
+
+def compact(today=None):
+    # Moves every row dated before today from the live CSV into its day's
+    # partition. Returns {day: rows archived}.
+    storage = get_storage()
+    if not isinstance(storage, CsvStorage):
+        raise RuntimeError("compaction only applies to the csv backend")
+
+    today = today or date.today()
+    archived = {}
+
+    with FileLock(str(storage.lock_file)):
+        if not storage.path.exists():
+            return archived
+
+        # Bring the item index fully up to date; it is handed over to the
+        # compacted log below so archived Office rows stay inheritable.
+        storage._sync_index()
+        storage._upgrade_schema()
+
+        inode = storage.path.stat().st_ino
+        df = pd.read_csv(storage.path, dtype=str, keep_default_na=False)
+        days = pd.to_datetime(df["timestamp"], errors="coerce").dt.date
+        closed = (days < today).fillna(False).astype(bool)
+
+        if not closed.any():
+            return archived
+
+        # Rows an interrupted run already put into their partitions
+        done_rows, done_days = _read_journal(inode)
+        done = (df.index < done_rows) & days.isin(done_days)
+
+        for day, rows in df[closed & ~done].groupby(days[closed & ~done]):
+            archived[day] = len(rows)
+            rows = coerce_frame(rows)
+
+            # Late rows for an already archived day are merged in
+            path = partition_path(day)
+            if path.exists():
+                rows = pd.concat([read_partition(day), rows], ignore_index=True)
+
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            to_columnar(rows).to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+
+            done_days.add(day)
+            _write_journal(inode, len(df), done_days)
+
+        # Partitions are in place; now swap in the log without them
+        live = df[~closed]
+        tmp = storage.path.with_name(f"{storage.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(storage._encode_rows(live.to_dict("records"), header=True))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, storage.path)
+
+        stat = storage.path.stat()
+        storage._index["inode"] = stat.st_ino
+        storage._index["offset"] = stat.st_size
+        storage._save_index()
+
+        COMPACT_JOURNAL.unlink(missing_ok=True)
+
+    return archived
+
+# ==================================================
+# PARTITION READER (DASHBOARD)
+# ==================================================
+# The partitions a query needs are read and concatenated once (categories
+# unified, so model/location/substance stay categorical) and kept per
+# window, keyed on the partitions' mtimes so anything compaction rewrote
+# is reloaded. Only the last ARCHIVE_WINDOWS_CACHED windows are kept, and
+# a cached window that covers the requested days is reused for them.
+ARCHIVE_WINDOWS_CACHED = 3
+
+
+class ArchiveReader:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+
+    def signature(self):
+        # Changes whenever a partition is added or rewritten
+        return tuple(
+            (day, partition_path(day).stat().st_mtime_ns)
+            for day in partition_days()
+        )
+
+    def days(self, start_date=None, end_date=None):
+        # Partitions overlapping the dashboard date window (which runs up to
+        # midnight after end_date)
+        first = pd.to_datetime(start_date).date() if start_date else date.min
+        last = (
+            (pd.to_datetime(end_date) + pd.Timedelta(days=1)).date()
+            if end_date else date.max
+        )
+        return [day for day in partition_days() if first <= day <= last]
+
+    def frame(self, start_date=None, end_date=None):
+        # Every partition overlapping the window as one frame, or None when
+        # there are none. May hold rows outside the window; callers filter
+        # by date anyway.
+        days = set(self.days(start_date, end_date))
+        wanted = tuple(entry for entry in self.signature() if entry[0] in days)
+        if not wanted:
+            return None
+
+        with self._lock:
+            for key, frame in self._windows.items():
+                if set(wanted) <= set(key):
+                    self._windows.move_to_end(key)
+                    return frame
+
+        frame = concat_frames([read_partition(day) for day, _ in wanted])
+
+        with self._lock:
+            self._windows[wanted] = frame
+            while len(self._windows) > ARCHIVE_WINDOWS_CACHED:
+                self._windows.popitem(last=False)
+        return frame
+
+
+if __name__ == "__main__":
+    result = compact()
+    if not result:
+        print("Nothing to archive.")
+    for day, count in result.items():
+        print(f"✅ {day}: archived {count} rows → {partition_path(day).name}")
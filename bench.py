@@ -0,0 +1,388 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import csv
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# ==================================================
+# BENCHMARK SUITE
+# ==================================================
+# Reproducible timings for the three paths that grow with the log:
+#   write     - per-scan latency of tracker.log_movement on a big log
+#   dashboard - update_table for each filter mode (none/item/model/date)
+#   labels    - single label PDFs and batch label sheets per second
+# Everything runs against a synthetic log in a scratch directory, never the
+# real srv/data. Results are written as JSON; pass --compare with an older
+# result file to print the change per metric.
+#
+#   python bench.py --rows 1000000 --output bench_results.json
+#   python bench.py generate --rows 200000 --out trace_log.csv
+FLOW = ["Office", "Incoming", "QC", "FG", "Shipment"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DEFAULT_ROWS = 100_000
+DEFAULT_ITEMS = 20_000
+DEFAULT_MODELS = 50
+DEFAULT_DAYS = 30
+DEFAULT_END_DATE = "2025-01-31"
+DEFAULT_SEED = 42
+
+# ==================================================
+# SYNTHETIC TRACE LOG
+# ==================================================
+def _item_ids(items, days, end):
+    # NMyymmdd_nnn, spread evenly over the generated days like the Office
+    # counter would hand them out
+    per_day = -(-items // days)
+    for n in range(items):
+        day = end - timedelta(days=days - 1 - n // per_day)
+        yield f"NM{day:%y%m%d}_{n % per_day + 1:03d}", day
+
+
+def generate_rows(rows=DEFAULT_ROWS, items=DEFAULT_ITEMS, models=DEFAULT_MODELS,
+                  days=DEFAULT_DAYS, end_date=DEFAULT_END_DATE, seed=DEFAULT_SEED):
+    # Yields trace rows (dicts with the storage COLUMNS) in timestamp
+    # order per item. Every item starts at the Office and moves down FLOW;
+    # some stop early (still in progress) and some get re-scanned at a
+    # station, so the log has the same mix of stages and repeats as a real
+    # one. Items are cycled through until `rows` rows were produced.
+    from storage import to_epoch
+
+    rng = random.Random(seed)
+    end = datetime.fromisoformat(end_date)
+    model_names = [f"MODEL-{m:03d}" for m in range(models)]
+    substances = ["SUS304", "SUS316", "AL6061", "BRASS", "PP"]
+
+    produced = 0
+    while produced < rows:
+        for item_id, day in _item_ids(items, days, end):
+            model = rng.choice(model_names)
+            substance = rng.choice(substances)
+            quantity = rng.randint(1, 500)
+            t = day + timedelta(seconds=rng.randint(8 * 3600, 17 * 3600))
+
+            # Most items finish the flow; the rest are work in progress
+            stages = len(FLOW) if rng.random() < 0.7 else rng.randint(1, len(FLOW) - 1)
+            for location in FLOW[:stages]:
+                scans = 2 if rng.random() < 0.05 else 1
+                for _ in range(scans):
+                    yield {
+                        # Same text the stations write (tracker._now)
+                        "timestamp": t.isoformat(),
+                        "item_id": item_id,
+                        "location": location,
+                        "status": quantity,
+                        "model": model,
+                        "substance": substance,
+                        "epoch": to_epoch(t),
+                    }
+                    produced += 1
+                    if produced >= rows:
+                        return
+                    t += timedelta(minutes=rng.randint(5, 240))
+
+
+def generate_trace_log(path, rows=DEFAULT_ROWS, **kwargs):
+    from storage import COLUMNS
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(generate_rows(rows, **kwargs))
+    return path
+
+# ==================================================
+# HELPERS
+# ==================================================
+def _summary(samples):
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pct(50) * 1000,
+        "p90_ms": pct(90) * 1000,
+        "p99_ms": pct(99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _use_workdir(workdir, backend):
+    # Point storage, archive and label output at the scratch directory
+    import archive
+    import office
+    import storage
+
+    log_path = workdir / "trace_log.csv"
+    if backend == "sqlite":
+        db_path = workdir / "trace_log.db"
+        storage.migrate_csv_to_sqlite(log_path, db_path)
+        backend_storage = storage.SqliteStorage(db_path)
+    else:
+        backend_storage = storage.CsvStorage(log_path)
+
+    storage.BACKEND = backend
+    storage._storage = backend_storage
+    archive.ARCHIVE_DIR = workdir / "archive"
+    archive.ARCHIVE_DIR.mkdir(exist_ok=True)
+    office.PDF_DIR = workdir / "pdf"
+    office.PDF_DIR.mkdir(exist_ok=True)
+    return backend_storage
+
+# ==================================================
+# BENCHMARKS
+# ==================================================
+def bench_write(scans, rng):
+    import tracker
+    from storage import get_storage
+
+    # First transaction builds the item index from the whole log
+    get_storage()
+    cold = _timed(tracker.log_movement, "BENCH_000", "Office", "1", "BENCH", "-")
+
+    items = [f"BENCH_{n:03d}" for n in range(1, 101)]
+    for item_id in items:
+        tracker.log_movement(item_id, "Office", "1", "BENCH", "-")
+
+    samples = [
+        _timed(tracker.log_movement, rng.choice(items), rng.choice(FLOW[1:]), "1", "-", "-")
+        for _ in range(scans)
+    ]
+
+    batch = [{"item_id": rng.choice(items), "status": "1"} for _ in range(100)]
+    batch_seconds = _timed(tracker.log_movements, batch, "QC")
+
+    return {
+        "cold_first_scan_ms": cold * 1000,
+        "scan": _summary(samples),
+        "batch_100_ms": batch_seconds * 1000,
+    }
+
+
+def bench_dashboard(repeats, rng):
+    import dashboard
+    from snapshot import TraceSnapshot
+
+    # Fresh snapshot, so the first refresh loads the whole log
+    dashboard.snapshot = TraceSnapshot()
+    cold = _timed(dashboard.snapshot.refresh)
+
+    df = dashboard.snapshot.df
+    item_id = rng.choice(df["item_id"].unique().tolist())
+    model = rng.choice(df["model"].unique().tolist())
+    last_day = df["timestamp"].max().normalize()
+    start_date = (last_day - timedelta(days=6)).date().isoformat()
+    end_date = last_day.date().isoformat()
+
+    modes = {
+        "none": (None, None, None, None),
+        "item": (item_id, None, None, None),
+        "model": (None, model, None, None),
+        "date_range": (None, None, start_date, end_date),
+    }
+
+    results = {"cold_load_ms": cold * 1000, "rows": len(df)}
+    def render(item, mdl, start, end):
+        # rendered_key=None and an empty query cache force a full render
+        dashboard.query_cache.clear()
+        dashboard.update_table(0, item, mdl, start, end, 0, 20, [], "", None)
+
+    for mode, args in modes.items():
+        results[mode] = _summary([_timed(render, *args) for _ in range(repeats)])
+
+    # Another tab on the same query and log version: served from the cache
+    dashboard.update_table(0, None, model, None, None, 0, 20, [], "", None)
+    results["cached_model"] = _summary([
+        _timed(dashboard.update_table, 0, None, model, None, None, 0, 20, [], "", None)
+        for _ in range(repeats)
+    ])
+
+    # Unchanged log and inputs: the cheap path every interval tick takes
+    key = dashboard.update_table(0, None, None, None, None, 0, 20, [], "", None)[-1]
+    results["unchanged"] = _summary([
+        _timed(dashboard.update_table, 0, None, None, None, None, 0, 20, [], "", key)
+        for _ in range(repeats)
+    ])
+    return results
+
+
+def bench_labels(singles, batch):
+    import office
+
+    item_ids = [f"NM991231_{n:03d}" for n in range(1, max(singles, batch) + 1)]
+
+    single_seconds = sum(
+        _timed(office.generate_pdf, item_id, "BENCH", "-", "1", "Office")
+        for item_id in item_ids[:singles]
+    )
+    sheet_seconds = _timed(
+        office.generate_label_sheet, item_ids[:batch], "BENCH", "-", "1", "Office"
+    )
+
+    return {
+        "single_pdf": {
+            "labels": singles,
+            "labels_per_s": singles / single_seconds,
+            "mean_ms": single_seconds / singles * 1000,
+        },
+        "label_sheet": {
+            "labels": batch,
+            "labels_per_s": batch / sheet_seconds,
+            "total_ms": sheet_seconds * 1000,
+        },
+    }
+
+# ==================================================
+# COMPARISON
+# ==================================================
+def _flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new):
+    before = _flatten(old["results"])
+    after = _flatten(new["results"])
+    print(f"\n{'metric':<45}{'before':>12}{'after':>12}{'change':>10}")
+    for name in sorted(before.keys() & after.keys()):
+        a, b = before[name], after[name]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+        print(f"{name:<45}{a:>12.2f}{b:>12.2f}{change:>10}")
+
+# ==================================================
+# ENTRY POINT
+# ==================================================
+def _generator_args(parser):
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--items", type=int, default=DEFAULT_ITEMS)
+    parser.add_argument("--models", type=int, default=DEFAULT_MODELS)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--end-date", default=DEFAULT_END_DATE)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+
+def _generator_kwargs(args):
+    return {
+        "items": args.items, "models": args.models, "days": args.days,
+        "end_date": args.end_date, "seed": args.seed,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv[:1] == ["generate"]:
+        parser = argparse.ArgumentParser(prog="bench.py generate")
+        _generator_args(parser)
+        parser.add_argument("--out", default="trace_log.csv")
+        args = parser.parse_args(argv[1:])
+        path = generate_trace_log(args.out, args.rows, **_generator_kwargs(args))
+        print(f"✅ Wrote {args.rows} rows → {path}")
+        return
+
+    parser = argparse.ArgumentParser(prog="bench.py")
+    _generator_args(parser)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--labels", type=int, default=20)
+    parser.add_argument("--sheet-labels", type=int, default=200)
+    parser.add_argument("--only", choices=["write", "dashboard", "labels"], action="append")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    args = parser.parse_args(argv)
+
+    only = set(args.only or ["write", "dashboard", "labels"])
+    rng = random.Random(args.seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="trace_bench_") as tmp:
+        workdir = Path(tmp)
+
+        print(f"⏳ Generating {args.rows} rows…")
+        generate_seconds = _timed(
+            generate_trace_log, workdir / "trace_log.csv", args.rows,
+            **_generator_kwargs(args),
+        )
+        backend_storage = _use_workdir(workdir, args.backend)
+
+        # Dashboard first, so it sees exactly the generated log
+        if "dashboard" in only:
+            print("⏳ Dashboard refresh…")
+            results["dashboard"] = bench_dashboard(args.repeats, rng)
+        if "write" in only:
+            print("⏳ Scan write latency…")
+            results["write"] = bench_write(args.scans, rng)
+        if "labels" in only:
+            print("⏳ Label rendering…")
+            results["labels"] = bench_labels(args.labels, args.sheet_labels)
+
+        # The scratch log is deleted with the directory; drop its item
+        # index so the exit hook has nothing to save
+        if args.backend == "csv":
+            backend_storage._index = None
+
+    report = {
+        "meta": {
+            "created": datetime.now().strftime(TIME_FORMAT),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "generate_seconds": generate_seconds,
+            "params": {
+                "rows": args.rows, "scans": args.scans, "repeats": args.repeats,
+                "labels": args.labels, "sheet_labels": args.sheet_labels,
+                **_generator_kwargs(args),
+            },
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved → {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
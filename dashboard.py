@@ -1,25 +1,27 @@
-import sys
+import functools
+import os
 import threading
+import time
 import webbrowser
-from pathlib import Path
 
 import pandas as pd
-from dash import Dash, html, dash_table, dcc
-from dash.dependencies import Input, Output
+from dash import Dash, html, dash_table, dcc, no_update
+from dash.dash_table.Format import Format
+from dash.dependencies import Input, Output, State
+import math
+from urllib.parse import urlencode
 
-# ==================================================
-# EXE-SAFE BASE DIRECTORY
-# ==================================================
-def get_base_dir():
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).resolve().parent
-    return Path(__file__).resolve().parent
-
-
-BASE_DIR = get_base_dir()
+from flask import Response, abort, request
 
-TRACE_LOG = BASE_DIR / "srv" / "data" / "trace_log.csv"
-TRACE_LOG.parent.mkdir(parents=True, exist_ok=True)
+import metrics
+from export import (
+    EXPORT_COLUMNS, XLSX_MIMETYPE, csv_chunks, export_filename, export_frames, file_chunks, write_xlsx,
+)
+from aggregates import matrix_row, quantity_matrix
+from query_cache import QueryCache
+from shared_snapshot import SharedTraceSnapshot
+from snapshot import TraceSnapshot
+from storage import get_storage
 
 # ==================================================
 # COLUMN DISPLAY LABELS (UI ONLY)
@@ -35,10 +37,27 @@ COLUMN_LABELS = {
 
 LOCATIONS = ["Office", "Incoming", "QC", "FG", "Shipment"]
 
+# Work orders per page in the model summary
+ITEM_ROWS_PER_PAGE = 20
+
+# Turn on when serving app.server from several worker processes, e.g.
+#   TRACE_SHARED_SNAPSHOT=1 gunicorn -w 4 dashboard:server
+# They then map one published snapshot instead of each parsing the log
+SHARED_SNAPSHOT = os.environ.get("TRACE_SHARED_SNAPSHOT", "") not in ("", "0")
+
+# Parsed trace log, refreshed incrementally and shared by all clients
+snapshot = SharedTraceSnapshot() if SHARED_SNAPSHOT else TraceSnapshot()
+
 # ==================================================
 # DASH APP
 # ==================================================
 app = Dash(__name__)
+server = app.server
+
+
+@app.server.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
 
 app.layout = html.Div(
     style={"padding": "20px", "fontFamily": "Arial"},
@@ -121,6 +140,9 @@ app.layout = html.Div(
                     placeholder="End Date",
                     display_format="DD-MM-YYYY",
                 ),
+                # Download the rows matching the filters above
+                html.A("⬇ CSV", id="export-csv", href="", target="_blank"),
+                html.A("⬇ Excel", id="export-xlsx", href="", target="_blank"),
             ],
         ),
 
@@ -128,6 +150,9 @@ app.layout = html.Div(
 
         dcc.Interval(id="refresh", interval=3000, n_intervals=0),
 
+        # Log version + inputs this tab last rendered (see update_table)
+        dcc.Store(id="rendered-key"),
+
         html.Div(id="current-status"),
         html.Br(),
 
@@ -143,75 +168,165 @@ app.layout = html.Div(
         html.Div(id="item-detail-view"),
         html.Br(),
 
+        # ----------------------
+        # STAGE FLOW VIEW
+        # ----------------------
+        html.Div(id="flow-summary"),
+        dcc.Store(id="flow-key"),
+        html.Br(),
+
         # ----------------------
         # TABLE VIEW
         # ----------------------
+        # Paged, sorted and filtered on the server so only the
+        # visible page is sent to the browser
         dash_table.DataTable(
             id="trace-table",
+            page_current=0,
             page_size=10,
+            page_action="custom",
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
+            filter_action="custom",
+            filter_query="",
             style_table={"overflowX": "auto"},
             style_cell={"textAlign": "left"},
         ),
+        html.Small(id="trace-count"),
     ],
 )
 
 # ==================================================
-# CALLBACK
+# TABLE FILTER / SORT / PAGE
 # ==================================================
-@app.callback(
-    Output("trace-table", "data"),
-    Output("trace-table", "columns"),
-    Output("current-status", "children"),
-    Output("item-detail-view", "children"),
-    Output("item-summary", "children"),
-    Input("refresh", "n_intervals"),
-    Input("search-item", "value"),
-    Input("search-model", "value"),
-    Input("start-date", "date"),
-    Input("end-date", "date"),
-)
-def update_table(_, item_id, selected_model, start_date, end_date):
+FILTER_OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def split_filter_part(filter_part):
+    # Parses one "{column} op value" clause of a DataTable filter_query
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1: name_part.rfind("}")]
+
+                operator = operator_type[0].strip()
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ""
+                if v0 == value_part[-1:] and v0 in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + v0, v0)
+                elif operator in ("contains", "datestartswith"):
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                return name, operator, value
+
+    return [None] * 3
+
+
+def apply_table_query(df, filter_query, sort_by):
+    for filter_part in (filter_query or "").split(" && "):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+
+        col = df[col_name]
+        if operator in ("contains", "datestartswith") or (
+            isinstance(filter_value, str) and col_name != "timestamp"
+        ):
+            col = col.astype(str)
+            filter_value = str(filter_value)
+        elif col_name == "timestamp":
+            filter_value = pd.to_datetime(str(filter_value), errors="coerce")
+
+        if operator == "eq":
+            df = df.loc[col == filter_value]
+        elif operator == "ne":
+            df = df.loc[col != filter_value]
+        elif operator == "lt":
+            df = df.loc[col < filter_value]
+        elif operator == "le":
+            df = df.loc[col <= filter_value]
+        elif operator == "gt":
+            df = df.loc[col > filter_value]
+        elif operator == "ge":
+            df = df.loc[col >= filter_value]
+        elif operator == "contains":
+            df = df.loc[col.str.contains(filter_value, regex=False)]
+        elif operator == "datestartswith":
+            df = df.loc[col.str.startswith(filter_value)]
+
+    if sort_by:
+        df = df.sort_values(
+            [s["column_id"] for s in sort_by],
+            ascending=[s["direction"] == "asc" for s in sort_by],
+            kind="stable",
+        )
+
+    return df
 
 
-    if not TRACE_LOG.exists():
-        return [], [], "No trace data yet.", "", ""
+def table_page(df, page_current, page_size):
+    page_size = page_size or 10
+    page_count = max(1, math.ceil(len(df) / page_size))
+    page = min(page_current or 0, page_count - 1)
+    return (
+        df.iloc[page * page_size: (page + 1) * page_size].to_dict("records"),
+        page_count,
+    )
 
-    df = pd.read_csv(TRACE_LOG)
-    # df = pd.read_csv(TRACE_LOG)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+# ==================================================
+# QUERY VIEWS (CACHED PER LOG VERSION)
+# ==================================================
+# Everything that depends only on the filters and the log contents, so
+# tabs showing the same item/model/date range share one computation.
+query_cache = QueryCache()
 
-    # Apply date filter if selected
-    if start_date:
-        df = df[df["timestamp"] >= pd.to_datetime(start_date)]
 
-    if end_date:
-        df = df[df["timestamp"] <= pd.to_datetime(end_date) + pd.Timedelta(days=1)]
+def query_key(item_id, selected_model, start_date, end_date):
+    # Item ID > Model > All (date range applies to all), so a model typed
+    # next to an item does not make a separate entry
+    item_id = item_id or None
+    selected_model = None if item_id else (selected_model or None)
+    return item_id, selected_model, start_date or None, end_date or None
 
-    # Ensure quantity is numeric
-    df["status"] = pd.to_numeric(df["status"], errors="coerce").fillna(0)
 
-    # ==================================================
-    # FILTER PRIORITY
-    # Item ID > Model > All
-    # ==================================================
-    if item_id:
-        df_filtered = df[df["item_id"] == item_id]
-    elif selected_model:
-        df_filtered = df[df["model"] == selected_model]
-    else:
-        df_filtered = df
+def build_query_views(item_id, selected_model, start_date, end_date):
+    df_filtered = snapshot.query(
+        item_id=item_id,
+        model=selected_model,
+        start_date=start_date,
+        end_date=end_date,
+    )
 
-    # ==================================================
-    # TABLE
-    # ==================================================
-    columns = [{"name": COLUMN_LABELS.get(c, c), "id": c} for c in df.columns]
+    columns = [{"name": COLUMN_LABELS.get(c, c), "id": c} for c in df_filtered.columns]
 
     # ==================================================
     # CURRENT STATUS
     # ==================================================
     status_view = "No item selected"
     if not df_filtered.empty:
-        last = df_filtered.sort_values("timestamp").iloc[-1]
+        # Latest scan without sorting the history; on a tie, the row
+        # logged last
+        timestamps = df_filtered["timestamp"]
+        if timestamps.notna().any():
+            last = df_filtered.loc[timestamps[::-1].idxmax()]
+        else:
+            last = df_filtered.iloc[-1]
         status_view = html.B(
             f"Last seen → {last['location']} | Qty: {int(last['status'])} | Time: {last['timestamp']}"
         )
@@ -222,7 +337,10 @@ def update_table(_, item_id, selected_model, start_date, end_date):
     detail_view = ""
     if item_id and not df_filtered.empty:
         cards = []
-        for _, row in df_filtered.sort_values("timestamp").iterrows():
+        timeline = df_filtered.sort_values("timestamp")
+        for location, quantity, timestamp in zip(
+            timeline["location"], timeline["status"], timeline["timestamp"]
+        ):
             cards.append(
                 html.Div(
                     style={
@@ -233,9 +351,9 @@ def update_table(_, item_id, selected_model, start_date, end_date):
                         "backgroundColor": "#f9f9f9",
                     },
                     children=[
-                        html.Div([html.B("Location: "), row["location"]]),
-                        html.Div([html.B("Quantity: "), int(row["status"])]),
-                        html.Small(f"Time: {row['timestamp']}"),
+                        html.Div([html.B("Location: "), location]),
+                        html.Div([html.B("Quantity: "), int(quantity)]),
+                        html.Small(f"Time: {timestamp}"),
                     ],
                 )
             )
@@ -252,6 +370,10 @@ def update_table(_, item_id, selected_model, start_date, end_date):
     # ==================================================
     summary_view = ""
 
+    # Without a date range the totals cover the whole log and come
+    # straight from the snapshot's precomputed aggregates
+    aggregates = None if start_date or end_date else snapshot.aggregates
+
     # ----------------------
     # ITEM SUMMARY
     # ----------------------
@@ -260,10 +382,10 @@ def update_table(_, item_id, selected_model, start_date, end_date):
         office_rows = df_filtered[df_filtered["location"] == "Office"]
         model = office_rows.iloc[-1]["model"] if not office_rows.empty else "-"
 
-        qty_by_location = {
-            loc: int(df_filtered[df_filtered["location"] == loc]["status"].sum())
-            for loc in LOCATIONS
-        }
+        if aggregates is not None:
+            qty_by_location = aggregates.item_quantities(item_id, LOCATIONS)
+        else:
+            qty_by_location = matrix_row(quantity_matrix(df_filtered, LOCATIONS))
 
         summary_view = html.Div(
             style={
@@ -308,15 +430,16 @@ def update_table(_, item_id, selected_model, start_date, end_date):
     # ----------------------
     elif selected_model and not df_filtered.empty:
 
-        blocks = []
-
         # =========================
         # OVERALL MODEL TOTALS
         # =========================
-        overall_qty = {
-            loc: int(df_filtered[df_filtered["location"] == loc]["status"].sum())
-            for loc in LOCATIONS
-        }
+        if aggregates is not None:
+            overall_qty = aggregates.model_quantities(selected_model, LOCATIONS)
+            matrix = aggregates.model_item_matrix(selected_model, LOCATIONS)
+        else:
+            # One item x location pivot feeds both the totals and the table
+            matrix = quantity_matrix(df_filtered, LOCATIONS)
+            overall_qty = matrix_row(matrix)
 
         overall_block = html.Div(
             style={
@@ -356,67 +479,276 @@ def update_table(_, item_id, selected_model, start_date, end_date):
         )
 
 
-        for item, df_item in df_filtered.groupby("item_id"):
-            qty_by_location = {
-                loc: int(df_item[df_item["location"] == loc]["status"].sum())
-                for loc in LOCATIONS
-            }
-
-            blocks.append(
-                html.Div(
-                    style={
-                        "border": "2px solid #aaa",
-                        "borderRadius": "10px",
-                        "padding": "14px",
-                        "marginBottom": "12px",
-                        "backgroundColor": "#f9f9f9",
-                    },
-                    children=[
-                        html.Div([
-                            html.B("Model: "), selected_model,
-                            html.Span(" | "),
-                            html.B("Item ID: "), item,
-                        ]),
-                        html.Br(),
-                        html.Table(
-                            style={"width": "100%", "textAlign": "center"},
-                            children=[
-                                html.Thead(
-                                    html.Tr(
-                                        [html.Th("Location")] +
-                                        [html.Th(loc) for loc in LOCATIONS]
-                                    )
-                                ),
-                                html.Tbody(
-                                    html.Tr(
-                                        [html.Td("Quantity")] +
-                                        [
-                                            html.Td(qty_by_location[loc] if qty_by_location[loc] > 0 else "-")
-                                            for loc in LOCATIONS
-                                        ]
-                                    )
-                                ),
-                            ],
-                        ),
+        # One row per work order in a client-side paged table; building a
+        # block of components per item took seconds for big models
+        item_rows = (
+            matrix.astype(object).where(matrix > 0, None)
+            .rename_axis("item_id")
+            .reset_index()
+            .to_dict("records")
+        )
+        items_block = html.Div(
+            style={
+                "border": "2px solid #aaa",
+                "borderRadius": "10px",
+                "padding": "14px",
+                "backgroundColor": "#f9f9f9",
+            },
+            children=[
+                html.Div([
+                    html.B("Model: "), selected_model,
+                    html.Span(" | "),
+                    html.B("Work Orders: "), len(item_rows),
+                ]),
+                html.Br(),
+                dash_table.DataTable(
+                    columns=[{"name": COLUMN_LABELS["item_id"], "id": "item_id"}] + [
+                        {"name": loc, "id": loc, "type": "numeric",
+                         "format": Format(nully="-")}
+                        for loc in LOCATIONS
                     ],
-                )
-            )
+                    data=item_rows,
+                    page_size=ITEM_ROWS_PER_PAGE,
+                    sort_action="native",
+                    filter_action="native",
+                    style_cell={"textAlign": "center"},
+                ),
+            ],
+        )
 
         summary_view = html.Div(
             children=[
                 html.H3("📊 Status Summary"),
                 overall_block,   # 👈 NEW overall totals first
-                *blocks          # existing per-item blocks
+                items_block,
             ]
         )
 
+    return df_filtered, columns, status_view, detail_view, summary_view
+
+
+# ==================================================
+# CALLBACK
+# ==================================================
+def timed_callback(func):
+    # Records each run in dashboard_callback_seconds; "unchanged" runs are
+    # the ones that returned no_update for every output
+    @functools.wraps(func)
+    def wrapper(*args):
+        start = time.perf_counter()
+        result = func(*args)
+        outcome = "unchanged" if all(r is no_update for r in result) else "rendered"
+        metrics.CALLBACK_SECONDS.labels(func.__name__, outcome).observe(
+            time.perf_counter() - start
+        )
+        return result
+    return wrapper
+
+
+@app.callback(
+    Output("trace-table", "data"),
+    Output("trace-table", "columns"),
+    Output("trace-table", "page_count"),
+    Output("trace-count", "children"),
+    Output("current-status", "children"),
+    Output("item-detail-view", "children"),
+    Output("item-summary", "children"),
+    Output("rendered-key", "data"),
+    Input("refresh", "n_intervals"),
+    Input("search-item", "value"),
+    Input("search-model", "value"),
+    Input("start-date", "date"),
+    Input("end-date", "date"),
+    Input("trace-table", "page_current"),
+    Input("trace-table", "page_size"),
+    Input("trace-table", "sort_by"),
+    Input("trace-table", "filter_query"),
+    State("rendered-key", "data"),
+)
+@timed_callback
+def update_table(
+    _, item_id, selected_model, start_date, end_date,
+    page_current, page_size, sort_by, filter_query, rendered_key,
+):
+
+    # ==================================================
+    # CHANGE CHECK
+    # Nothing scanned and no input changed -> keep what the tab shows
+    # ==================================================
+    storage = get_storage()
+    version = storage.version()
+    render_key = [
+        version, item_id, selected_model, start_date, end_date,
+        page_current, page_size, sort_by, filter_query,
+    ]
+    if render_key == rendered_key:
+        return (no_update,) * 8
+
+    if version is None:
+        return [], [], 1, "", "No trace data yet.", "", "", render_key
+
+    key = query_key(item_id, selected_model, start_date, end_date)
+    df_filtered, columns, status_view, detail_view, summary_view = query_cache.get(
+        version, key, lambda: build_query_views(*key)
+    )
+
+    # ==================================================
+    # TABLE
+    # ==================================================
+    df_table = apply_table_query(df_filtered, filter_query, sort_by)
+    table_data, page_count = table_page(df_table, page_current, page_size)
+    table_count = f"{len(df_table)} rows"
 
     return (
-        df_filtered.to_dict("records"),
+        table_data,
         columns,
+        page_count,
+        table_count,
         status_view,
         detail_view,
         summary_view,
+        render_key,
+    )
+
+# ==================================================
+# STAGE FLOW PANEL
+# ==================================================
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h {minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+
+def build_flow_view(selected_model):
+    # Whole-log figures from the snapshot's incrementally kept flow state
+    flow = snapshot.flow
+    # Items reaching the last stage have left the line; they are not WIP
+    wip = flow.wip_counts(LOCATIONS[:-1])
+    dwell_rows = [("All models", flow.dwell_percentiles(LOCATIONS))]
+    if selected_model:
+        dwell_rows.append(
+            (f"Model {selected_model}", flow.dwell_percentiles(LOCATIONS, selected_model))
+        )
+
+    header = html.Thead(
+        html.Tr([html.Th("")] + [html.Th(loc) for loc in LOCATIONS])
+    )
+
+    body = [html.Tr(
+        [html.Td("WIP (items)")] + [html.Td(wip.get(loc, "-")) for loc in LOCATIONS]
+    )]
+    for label, stats in dwell_rows:
+        body.append(html.Tr(
+            [html.Td(f"{label} — dwell p50 / p90")] +
+            [
+                html.Td(
+                    f"{format_duration(stats[loc][50])} / {format_duration(stats[loc][90])}"
+                    if stats[loc]["count"] else "-"
+                )
+                for loc in LOCATIONS
+            ]
+        ))
+
+    return html.Div(
+        style={
+            "border": "2px solid #27ae60",
+            "borderRadius": "10px",
+            "padding": "14px",
+            "backgroundColor": "#eefaf2",
+        },
+        children=[
+            html.H3("⏱ Stage Flow"),
+            html.Small(f"Work orders currently at each stage before {LOCATIONS[-1]}, "
+                       "and how long they stay there before moving on (whole log)."),
+            html.Br(), html.Br(),
+            html.Table(
+                style={"width": "100%", "textAlign": "center"},
+                children=[header, html.Tbody(body)],
+            ),
+        ],
+    )
+
+
+@app.callback(
+    Output("flow-summary", "children"),
+    Output("flow-key", "data"),
+    Input("refresh", "n_intervals"),
+    Input("search-model", "value"),
+    State("flow-key", "data"),
+)
+@timed_callback
+def update_flow_panel(_, selected_model, rendered_key):
+    version = get_storage().version()
+    selected_model = selected_model or None
+    flow_key = [version, selected_model]
+    if flow_key == rendered_key:
+        return no_update, no_update
+    if version is None:
+        return "", flow_key
+
+    snapshot.refresh()
+    view = query_cache.get(
+        version, ("flow", selected_model), lambda: build_flow_view(selected_model)
+    )
+    return view, flow_key
+
+# ==================================================
+# EXPORT
+# ==================================================
+# Served by Flask, not a callback, so a long export streams on its own
+# request thread instead of tying up callback workers
+@app.server.route("/export.<extension>")
+def export_rows(extension):
+    if extension not in ("csv", "xlsx"):
+        abort(404)
+
+    key = query_key(
+        request.args.get("item_id"), request.args.get("model"),
+        request.args.get("start_date"), request.args.get("end_date"),
+    )
+    try:
+        pd.to_datetime([d for d in key[2:] if d])
+    except ValueError:
+        abort(400)
+
+    labels = [COLUMN_LABELS[c] for c in EXPORT_COLUMNS]
+    headers = {
+        "Content-Disposition": f'attachment; filename="{export_filename(extension, *key)}"'
+    }
+    frames = export_frames(snapshot, *key)
+
+    if extension == "csv":
+        return Response(csv_chunks(frames, labels), mimetype="text/csv", headers=headers)
+
+    path = write_xlsx(frames, labels)
+    return Response(file_chunks(path), mimetype=XLSX_MIMETYPE, headers=headers)
+
+
+@app.callback(
+    Output("export-csv", "href"),
+    Output("export-xlsx", "href"),
+    Input("search-item", "value"),
+    Input("search-model", "value"),
+    Input("start-date", "date"),
+    Input("end-date", "date"),
+)
+def update_export_links(item_id, selected_model, start_date, end_date):
+    key = query_key(item_id, selected_model, start_date, end_date)
+    params = urlencode({
+        name: value
+        for name, value in zip(("item_id", "model", "start_date", "end_date"), key)
+        if value
+    })
+    return tuple(
+        app.get_relative_path(f"/export.{extension}") + (f"?{params}" if params else "")
+        for extension in ("csv", "xlsx")
     )
 
 # ==================================================
@@ -0,0 +1,123 @@
+import os
+import re
+import tempfile
+
+from archive import read_partition
+from storage import filter_frame
+
+# ==================================================
+# STREAMING EXPORT (CSV / XLSX)
+# ==================================================
+# Filtered trace rows for download, with the same item > model > all and
+# date window rules as the dashboard. Rows are produced one archive day
+# (then the live log) at a time and written out in chunks, so a year of
+# history never sits in memory at once.
+EXPORT_COLUMNS = ["timestamp", "item_id", "location", "status", "model", "substance"]
+EXPORT_CHUNK_ROWS = 10_000
+FILE_CHUNK_BYTES = 64 * 1024
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+XLSX_MAX_ROWS = 1_048_576   # per sheet, header included
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def export_frames(snapshot, item_id=None, model=None, start_date=None, end_date=None):
+    # Partitions are read directly rather than through the snapshot's
+    # partition cache, which would keep every exported day loaded
+    pushdown = None
+    if item_id:
+        pushdown = [("item_id", "==", item_id)]
+    elif model:
+        pushdown = [("model", "==", model)]
+
+    for day in snapshot.archive.days(start_date, end_date):
+        df = read_partition(day, columns=EXPORT_COLUMNS, filters=pushdown)
+        yield filter_frame(df, item_id, model, start_date, end_date)
+
+    yield snapshot.live(item_id, model, start_date, end_date)
+
+
+def export_filename(extension, item_id=None, model=None, start_date=None, end_date=None):
+    parts = ["trace", item_id or model or "all", start_date or "", end_date or ""]
+    name = "_".join(p for p in parts if p)
+    return re.sub(r"[^\w.-]", "_", name) + f".{extension}"
+
+# ==================================================
+# CSV
+# ==================================================
+def csv_chunks(frames, labels):
+    # BOM so Excel opens the file as UTF-8
+    yield "\ufeff" + ",".join(labels) + "\n"
+    for df in frames:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+            yield chunk[EXPORT_COLUMNS].to_csv(
+                header=False, index=False, date_format=TIME_FORMAT,
+                lineterminator="\n",
+            )
+
+# ==================================================
+# XLSX
+# ==================================================
+def _text(value):
+    return "" if value != value else str(value)   # NaN -> empty cell
+
+
+def write_xlsx(frames, labels):
+    # An xlsx is a zip and cannot be streamed while it is built, so it is
+    # written row by row to a temp file (constant_memory mode flushes each
+    # row) and streamed from there by file_chunks()
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(prefix="trace_export_", suffix=".xlsx")
+    os.close(fd)
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    time_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    sheet, row, sheets = None, XLSX_MAX_ROWS, 0
+
+    try:
+        for df in frames:
+            columns = [df[c] for c in EXPORT_COLUMNS]
+            for timestamp, *values in zip(*columns):
+                if row == XLSX_MAX_ROWS:
+                    sheets += 1
+                    sheet = workbook.add_worksheet(
+                        "Trace" if sheets == 1 else f"Trace ({sheets})"
+                    )
+                    sheet.write_row(0, 0, labels)
+                    sheet.set_column(0, 0, 20)
+                    row = 1
+
+                item_id, location, quantity, model, substance = values
+                if timestamp == timestamp:   # NaT != NaT
+                    sheet.write_datetime(row, 0, timestamp.to_pydatetime(), time_format)
+                sheet.write_string(row, 1, _text(item_id))
+                sheet.write_string(row, 2, _text(location))
+                sheet.write_number(row, 3, int(quantity))
+                sheet.write_string(row, 4, _text(model))
+                sheet.write_string(row, 5, _text(substance))
+                row += 1
+
+        if sheet is None:
+            workbook.add_worksheet("Trace").write_row(0, 0, labels)
+        workbook.close()
+    except BaseException:
+        workbook.close()
+        os.unlink(path)
+        raise
+
+    return path
+
+
+def file_chunks(path):
+    # Streams and then removes a finished export file
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
@@ -0,0 +1,122 @@
+import http.server
+import json
+import socketserver
+import sys
+import threading
+
+import metrics
+import tracker
+from storage import LEGACY_COLUMNS, parse_item_id, parse_quantity
+
+# ==========================
+# LOCAL INGEST DAEMON
+# ==========================
+# One writer process for every station on this PC. Stations with
+# tracker.USE_INGEST_DAEMON = True send their rows here over localhost TCP
+# instead of each taking trace_log.lock themselves; this process keeps the
+# item index in memory and group-commits whatever arrives together through
+# the tracker's write-behind queue.
+#
+# Protocol: one JSON object per line.
+#   request: {"rows": [{<COLUMNS>}, ...]} (epoch may be left out)
+#   reply:   {"ok": true, "rows": [...]} with model/substance inherited, or
+#            {"ok": false, "error": "...", "error_type": "ValueError"}
+#
+# The daemon's own metrics (requests, commits, lock waits) are served over
+# HTTP on METRICS_PORT at /metrics.
+HOST, PORT = tracker.INGEST_ADDRESS
+METRICS_PORT = 5545
+
+
+def _rows(request):
+    rows = request.get("rows") if isinstance(request, dict) else None
+    if not isinstance(rows, list):
+        raise ValueError("expected {\"rows\": [...]}")
+
+    checked = []
+    for row in rows:
+        if not isinstance(row, dict) or any(c not in row for c in LEGACY_COLUMNS):
+            raise ValueError(f"each row needs {', '.join(LEGACY_COLUMNS)}")
+        # epoch is optional; storage derives it from the timestamp
+        checked_row = {c: row[c] for c in LEGACY_COLUMNS}
+        parse_item_id(checked_row["item_id"])
+        checked_row["status"] = parse_quantity(checked_row["status"])
+        if row.get("epoch") is not None:
+            checked_row["epoch"] = int(row["epoch"])
+        checked.append(checked_row)
+    return checked
+
+
+class IngestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                committed = tracker._submit(_rows(json.loads(line)))
+                reply = {"ok": True, "rows": committed}
+            except ValueError as exc:
+                reply = {"ok": False, "error": str(exc), "error_type": "ValueError"}
+            except Exception as exc:
+                reply = {"ok": False, "error": repr(exc)}
+
+            metrics.INGEST_REQUESTS.labels("ok" if reply["ok"] else "error").inc()
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+
+
+class IngestServer(socketserver.ThreadingTCPServer):
+    # On Windows SO_REUSEADDR would let a second daemon bind the same port
+    allow_reuse_address = sys.platform != "win32"
+    daemon_threads = True
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scraped every few seconds; keep the console for errors
+        pass
+
+
+def start_metrics_server():
+    server = http.server.ThreadingHTTPServer((HOST, METRICS_PORT), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    # This process is the writer; never forward to itself
+    tracker.USE_INGEST_DAEMON = False
+    tracker.enable_write_behind("committed")
+
+    try:
+        server = IngestServer((HOST, PORT), IngestHandler)
+    except OSError as exc:
+        print(f"❌ Cannot listen on {HOST}:{PORT}: {exc}")
+        sys.exit(1)
+
+    try:
+        start_metrics_server()
+    except OSError as exc:
+        print(f"⚠️ Metrics not served on {HOST}:{METRICS_PORT}: {exc}")
+    else:
+        print(f"📈 Metrics on http://{HOST}:{METRICS_PORT}/metrics")
+
+    print(f"✅ Ingest daemon listening on {HOST}:{PORT} (Ctrl+C to stop)")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    tracker.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# ==================================================
+# IN-PROCESS METRICS (PROMETHEUS TEXT FORMAT)
+# ==================================================
+# Minimal counters, gauges and histograms for the hot paths. Each process
+# (station server, dashboard, ingest daemon) keeps its own registry and
+# exposes it on /metrics via render().
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+REGISTRY = []
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        return _Bound(self, tuple(str(v) for v in values))
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        inner = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + inner + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{self._label_text(key)} {value}"]
+
+
+class _Bound:
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def __getattr__(self, attr):
+        method = getattr(self._metric, attr)
+        return lambda *args, **kwargs: method(*args, key=self._key, **kwargs)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, key=()):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, key=()):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [per-bucket counts..., +Inf count, sum]
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bisect.bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, key=()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, key=key)
+
+    def _samples(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), value[:-1]):
+            cumulative += count
+            le = bound if bound == "+Inf" else repr(float(bound))
+            lines.append(
+                f"{self.name}_bucket{self._label_text(key, [('le', le)])} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{self._label_text(key)} {value[-1]}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in list(REGISTRY):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ==================================================
+# TRACE LOG WRITE PATH
+# ==================================================
+COMMIT_SECONDS = Histogram(
+    "trace_commit_seconds", "Total time to commit a group of movements"
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "trace_lock_wait_seconds", "Time spent waiting for the trace log write lock"
+)
+READ_SECONDS = Histogram(
+    "trace_read_seconds", "Time spent reading the log to sync the item index"
+)
+INHERIT_SECONDS = Histogram(
+    "trace_inherit_seconds", "Time spent on the Office inheritance lookup per row"
+)
+WRITE_SECONDS = Histogram(
+    "trace_write_seconds", "Time spent writing and syncing rows to storage"
+)
+ROWS_WRITTEN = Counter(
+    "trace_rows_written_total", "Movements written by this process"
+)
+LOG_ROWS = Gauge(
+    "trace_log_rows", "Rows in the trace log as of the last commit"
+)
+LOG_BYTES = Gauge(
+    "trace_log_bytes", "Size of the trace log file as of the last commit"
+)
+
+# ==================================================
+# DASHBOARD
+# ==================================================
+CALLBACK_SECONDS = Histogram(
+    "dashboard_callback_seconds",
+    "Dash callback duration; outcome is rendered or unchanged",
+    labelnames=("callback", "outcome"),
+)
+SNAPSHOT_REFRESH_SECONDS = Histogram(
+    "dashboard_snapshot_refresh_seconds", "Time to fold new log rows into the snapshot"
+)
+SNAPSHOT_ROWS = Gauge(
+    "dashboard_snapshot_rows", "Rows held in the live snapshot"
+)
+QUERY_CACHE_LOOKUPS = Counter(
+    "dashboard_query_cache_lookups_total",
+    "Dashboard query cache lookups by result (hit or miss)",
+    labelnames=("result",),
+)
+
+# ==================================================
+# INGEST DAEMON
+# ==================================================
+INGEST_FALLBACKS = Counter(
+    "trace_ingest_fallbacks_total",
+    "Writes done directly because the ingest daemon was unreachable",
+)
+INGEST_REQUESTS = Counter(
+    "trace_ingest_requests_total",
+    "Requests handled by the ingest daemon by outcome (ok or error)",
+    labelnames=("outcome",),
+)
@@ -1,19 +1,27 @@
-from tracker import log_movement
+from storage import parse_quantity
+from tracker import log_movement, log_movements
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+import io
 import json
+import multiprocessing
+import os
 import sys
+import threading
+from xml.sax.saxutils import escape
+from filelock import FileLock
 
-# PDF
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-import qrcode
-import os
+# PDF: ReportLab and qrcode are imported on the first label, not at
+# startup, so the prompt comes up without waiting for them
 
 DEBUG = False
 
+# Batch label sheets
+LABELS_PER_PAGE = 8
+LABEL_COLUMNS = 2
+POOL_MIN_LABELS = 20     # below this, rendering in-process is faster
+
 # ==============================
 # EXE-SAFE BASE DIR
 # ==============================
@@ -31,25 +39,70 @@ PDF_DIR.mkdir(parents=True, exist_ok=True)
 # ==============================
 # GENERATE DAILY ITEM ID
 # ==============================
-def generate_item_id():
-    today_str = datetime.now().strftime("%y%m%d")
+# Several label stations (this CLI, office_web, ...) share COUNTER_FILE, so
+# every read-modify-write happens under COUNTER_LOCK and the file is replaced
+# atomically. Each process reserves ID_BLOCK_SIZE numbers at a time and
+# hands them out from memory; numbers left in a block when the process exits
+# or the day rolls over are simply skipped.
+COUNTER_LOCK = COUNTER_FILE.with_suffix(".lock")
+ID_BLOCK_SIZE = 10
 
-    if COUNTER_FILE.exists():
-        with open(COUNTER_FILE, "r") as f:
-            data = json.load(f)
-    else:
-        data = {"date": today_str, "counter": 0}
+_id_block = {"date": None, "next": 0, "end": 0}
+_id_block_lock = threading.Lock()
+
+
+def _reserve_ids(count):
+    with FileLock(str(COUNTER_LOCK)):
+        today_str = datetime.now().strftime("%y%m%d")
+
+        try:
+            with open(COUNTER_FILE, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {"date": today_str, "counter": 0}
+
+        # Reset counter if new day
+        if data.get("date") != today_str:
+            data = {"date": today_str, "counter": 0}
+
+        first = data["counter"] + 1
+        data["counter"] += count
 
-    # Reset counter if new day
-    if data["date"] != today_str:
-        data = {"date": today_str, "counter": 0}
+        tmp = COUNTER_FILE.with_name(f"{COUNTER_FILE.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, COUNTER_FILE)
 
-    data["counter"] += 1
+    return today_str, first, data["counter"] + 1
 
-    with open(COUNTER_FILE, "w") as f:
-        json.dump(data, f)
 
-    return f"NM{today_str}_{data['counter']:03d}"
+def generate_item_ids(count):
+    ids = []
+    with _id_block_lock:
+        today_str = datetime.now().strftime("%y%m%d")
+        if _id_block["date"] != today_str:
+            _id_block.update(date=None, next=0, end=0)
+
+        while len(ids) < count:
+            if _id_block["next"] >= _id_block["end"]:
+                need = count - len(ids)
+                date_str, first, end = _reserve_ids(max(need, ID_BLOCK_SIZE))
+                _id_block.update(date=date_str, next=first, end=end)
+
+            take = min(count - len(ids), _id_block["end"] - _id_block["next"])
+            ids.extend(
+                f"NM{_id_block['date']}_{n:03d}"
+                for n in range(_id_block["next"], _id_block["next"] + take)
+            )
+            _id_block["next"] += take
+
+    return ids
+
+
+def generate_item_id():
+    return generate_item_ids(1)[0]
 
 
 # def create_label_pdf(item_id, model, substance, quantity):
@@ -85,11 +138,70 @@ def generate_item_id():
 
 #     return pdf_path
 
+# ==============================
+# LABEL STYLES (BUILT ONCE)
+# ==============================
+@lru_cache(maxsize=None)
+def label_styles():
+    # Built on first use; every later label reuses the same objects
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    styles = getSampleStyleSheet()
+
+    label_table = TableStyle([
+        ("BACKGROUND", (0, 0), (0, -1), colors.lightgrey),
+        ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 0), (-1, -1), 11),
+        ("ALIGN", (0, 0), (0, -1), "LEFT"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
+    ])
+
+    sheet_grid = TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ])
+
+    return {
+        "styles": styles,
+        "label_table": label_table,
+        "sheet_grid": sheet_grid,
+        "sheet_id": ParagraphStyle("LabelId", parent=styles["Heading4"], alignment=TA_CENTER),
+        "sheet_text": ParagraphStyle("LabelText", parent=styles["Normal"], alignment=TA_CENTER),
+    }
+
+# ==============================
+# QR CODE (IN MEMORY)
+# ==============================
+def render_qr_png(item_id):
+    # PNG bytes, never touching the disk; also runs in the batch workers
+    import qrcode
+
+    buf = io.BytesIO()
+    qrcode.make(item_id).save(buf)
+    return buf.getvalue()
+
+
+def qr_image(png, size):
+    from reportlab.platypus import Image
+
+    return Image(io.BytesIO(png), width=size, height=size)
+
+
 def generate_pdf(item_id, model, substance, quantity, location):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+
     pdf_path = PDF_DIR / f"{item_id}.pdf"
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    styles = getSampleStyleSheet()
+    styles = label_styles()["styles"]
     story = []
 
     # Title
@@ -109,16 +221,7 @@ def generate_pdf(item_id, model, substance, quantity, location):
     ]
 
     table = Table(data, colWidths=[140, 300])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (0, -1), colors.lightgrey),
-        ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 0), (-1, -1), 11),
-        ("ALIGN", (0, 0), (0, -1), "LEFT"),
-        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
-    ]))
+    table.setStyle(label_styles()["label_table"])
 
     story.append(table)
     story.append(Spacer(1, 20))
@@ -126,14 +229,9 @@ def generate_pdf(item_id, model, substance, quantity, location):
     # =========================
     # QR CODE GENERATION
     # =========================
-    qr_img_path = f"{item_id}_qr.png"
-
-    qr = qrcode.make(item_id)
-    qr.save(qr_img_path)
-
     story.append(Paragraph("Scan for Tracking", styles["Heading3"]))
     story.append(Spacer(1, 10))
-    story.append(Image(qr_img_path, width=240, height=240))
+    story.append(qr_image(render_qr_png(item_id), 240))
 
     # =========================
     # BUILD PDF
@@ -141,39 +239,141 @@ def generate_pdf(item_id, model, substance, quantity, location):
     doc = SimpleDocTemplate(str(pdf_path), pagesize=A4)
     doc.build(story)
 
-    # =========================
-    # DELETE TEMP QR IMAGE
-    # =========================
-    if os.path.exists(qr_img_path):
-        os.remove(qr_img_path)
-
     return pdf_path
 
 # ==============================
-# OFFICE SCANNER LOOP
+# BATCH LABEL SHEET
 # ==============================
-while True:
-    item_id = generate_item_id()
-    print(f"\n🆔 Generated QR Code: {item_id}")
+def generate_label_sheet(item_ids, model, substance, quantity, location,
+                         labels_per_page=LABELS_PER_PAGE, columns=LABEL_COLUMNS):
+    from concurrent.futures import ProcessPoolExecutor
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, PageBreak
+
+    styles = label_styles()
+    pdf_path = PDF_DIR / f"{item_ids[0]}-{item_ids[-1]}.pdf"
+
+    # QR rendering dominates; spread it over a process pool for big batches
+    if len(item_ids) >= POOL_MIN_LABELS:
+        with ProcessPoolExecutor() as pool:
+            pngs = list(pool.map(render_qr_png, item_ids, chunksize=16))
+    else:
+        pngs = [render_qr_png(item_id) for item_id in item_ids]
+
+    doc = SimpleDocTemplate(
+        str(pdf_path), pagesize=A4,
+        leftMargin=15 * mm, rightMargin=15 * mm,
+        topMargin=15 * mm, bottomMargin=15 * mm,
+    )
+
+    # Frame padding is 6pt per side; one table must fit a page exactly
+    rows_per_page = -(-labels_per_page // columns)
+    cell_w = (doc.width - 12) / columns
+    cell_h = (doc.height - 12) / rows_per_page
+    qr_size = min(cell_w, cell_h) - 22 * mm
+
+    # Paragraph text is markup; a model such as "A<B" must not be parsed
+    cells = [
+        [
+            Paragraph(f"<b>{escape(item_id)}</b>", styles["sheet_id"]),
+            Paragraph(f"Model: {escape(model)}", styles["sheet_text"]),
+            qr_image(png, qr_size),
+        ]
+        for item_id, png in zip(item_ids, pngs)
+    ]
+
+    story = []
+    for start in range(0, len(cells), labels_per_page):
+        page = cells[start:start + labels_per_page]
+        page += [""] * (-len(page) % columns)
+        grid = [page[i:i + columns] for i in range(0, len(page), columns)]
+
+        table = Table(grid, colWidths=cell_w, rowHeights=cell_h)
+        table.setStyle(styles["sheet_grid"])
+        story.append(table)
+        story.append(PageBreak())
+
+    doc.build(story[:-1])
+
+    return pdf_path
+
 
+def ask_quantity(prompt):
+    while True:
+        value = input(prompt).strip()
+        try:
+            return str(parse_quantity(value))
+        except ValueError as e:
+            print(f"❌ {e}")
+
+
+def run_batch(count):
     model = input("Model: ").strip()
     substance = input("Substance: ").strip()
-    status = input("Quantity: ").strip()
+    status = ask_quantity("Quantity (per label): ")
 
     location = "Office"
-    log = log_movement(item_id, location, status, model, substance)
-    if DEBUG:
-        print("✅ Logged:", log)
-    print("✅ Information saved.")
+    item_ids = generate_item_ids(count)
+    print(f"\n🆔 Generated QR Codes: {item_ids[0]} … {item_ids[-1]}")
 
-
-    # 🧾 Create PDF FIRST
-    # pdf_file = create_label_pdf(item_id, model, substance, status)
-    pdf_file = generate_pdf(item_id, model, substance, status, location)
+    # Sheet first: if it cannot be rendered, nothing is logged for labels
+    # that never got printed
+    pdf_file = generate_label_sheet(item_ids, model, substance, status, location)
     if DEBUG:
         print(f"PDF saved: {pdf_file}")
-    print("✅ PDF file saved. Open to print.")
 
-    cont = input("\nPress ENTER for next item or type 'q' to quit: ").strip().lower()
-    if cont == "q":
-        break
+    try:
+        logs = log_movements(
+            [{"item_id": item_id, "status": status} for item_id in item_ids],
+            location, model, substance,
+        )
+    except BaseException:
+        # Unlogged labels must not get printed
+        pdf_file.unlink(missing_ok=True)
+        raise
+    if DEBUG:
+        print("✅ Logged:", logs)
+    print(f"✅ Information saved for {len(logs)} items.")
+    print("✅ Label sheet saved. Open to print.")
+
+# ==============================
+# OFFICE SCANNER LOOP
+# ==============================
+def main():
+    while True:
+        count = input("\nLabels to create (ENTER for 1): ").strip()
+        count = int(count) if count.isdigit() and int(count) > 0 else 1
+
+        if count > 1:
+            run_batch(count)
+        else:
+            item_id = generate_item_id()
+            print(f"\n🆔 Generated QR Code: {item_id}")
+
+            model = input("Model: ").strip()
+            substance = input("Substance: ").strip()
+            status = ask_quantity("Quantity: ")
+
+            location = "Office"
+            log = log_movement(item_id, location, status, model, substance)
+            if DEBUG:
+                print("✅ Logged:", log)
+            print("✅ Information saved.")
+
+
+            # 🧾 Create PDF FIRST
+            # pdf_file = create_label_pdf(item_id, model, substance, status)
+            pdf_file = generate_pdf(item_id, model, substance, status, location)
+            if DEBUG:
+                print(f"PDF saved: {pdf_file}")
+            print("✅ PDF file saved. Open to print.")
+
+        cont = input("\nPress ENTER for next item or type 'q' to quit: ").strip().lower()
+        if cont == "q":
+            break
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
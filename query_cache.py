@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict, deque
+
+import metrics
+
+# ==================================================
+# DASHBOARD QUERY CACHE
+# ==================================================
+# Bounded LRU of per-query results (filtered frame + rendered summary
+# components) shared by every dashboard client. Keys carry the log version,
+# so a newer version evicts everything computed for older ones; identical
+# queries from several tabs on the same version are computed once, and a
+# client asking while another is still computing waits for that result.
+QUERY_CACHE_SIZE = 32
+
+
+class QueryCache:
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._version = None
+        # A request that read the version just before a scan can arrive
+        # after a newer one; it must not wipe the newer entries
+        self._retired = deque(maxlen=8)
+
+    def get(self, version, key, compute):
+        # compute() is called without the lock held, at most once per
+        # (version, key) while the entry stays cached
+        done = None
+        while True:
+            with self._lock:
+                if version in self._retired:
+                    break
+                if version != self._version:
+                    if self._version is not None:
+                        self._retired.append(self._version)
+                    self._entries.clear()
+                    self._version = version
+
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    metrics.QUERY_CACHE_LOOKUPS.labels("hit").inc()
+                    return self._entries[key]
+
+                waiting = self._pending.get(key)
+                if waiting is None:
+                    done = self._pending[key] = threading.Event()
+                    break
+
+            waiting.wait()
+
+        metrics.QUERY_CACHE_LOOKUPS.labels("miss").inc()
+        if done is None:
+            return compute()
+
+        try:
+            value = compute()
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
+
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
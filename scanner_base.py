@@ -1,7 +1,54 @@
 import sys
+import threading
+import urllib.request
+from collections import OrderedDict
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template_string
-from tracker import log_movement
+from flask import Flask, Response, request, jsonify, render_template_string, send_from_directory, url_for
+import metrics
+from storage import parse_item_id, parse_quantity
+from tracker import log_movement, log_movements
+
+# ==========================
+# EXE-SAFE BASE DIRECTORY
+# ==========================
+def get_base_dir():
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent
+
+BASE_DIR = get_base_dir()
+
+# Local copy of the scanner library so pages load without internet access.
+# Fetch it once per install (and ship the static folder next to the exe):
+#   python scanner_base.py fetch-library
+# The pinned CDN copy is only used while the file is missing.
+STATIC_DIR = BASE_DIR / "static"
+QR_LIBRARY = "html5-qrcode.min.js"
+QR_LIBRARY_VERSION = "2.3.8"
+QR_LIBRARY_CDN = f"https://unpkg.com/html5-qrcode@{QR_LIBRARY_VERSION}/{QR_LIBRARY}"
+
+
+# The page sends a random scan id with every scan and resends a batch with
+# the same ids when the reply was lost. The server keeps the last
+# SCAN_IDS_KEPT ids with their results and answers a repeat from there
+# instead of logging it again.
+SCAN_IDS_KEPT = 10000
+
+
+def _scan_id(entry):
+    scan_id = entry.get("scan_id")
+    return scan_id if isinstance(scan_id, str) and scan_id else None
+
+
+def fetch_qr_library():
+    STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    target = STATIC_DIR / QR_LIBRARY
+    tmp = target.with_name(target.name + ".tmp")
+    with urllib.request.urlopen(QR_LIBRARY_CDN, timeout=60) as res:
+        tmp.write_bytes(res.read())
+    tmp.replace(target)
+    return target
+
 
 def create_scanner_app(
     *,
@@ -11,66 +58,268 @@ def create_scanner_app(
 ):
     app = Flask(__name__)
 
+    # Continuous scanning: the camera stays open, every accepted scan is
+    # queued and posted in the background (several at once through
+    # /scan/batch), and results are listed inline instead of reloading.
     HTML = """
     <!DOCTYPE html>
     <html>
     <head>
       <meta name="viewport" content="width=device-width, initial-scale=1">
       <title>QR Scanner</title>
-      <script src="https://unpkg.com/html5-qrcode"></script>
+      <script src="{{ library_url }}"></script>
+      <style>
+        #log { list-style: none; padding: 0; font-family: monospace; }
+        .ok { color: #1e8449; }
+        .fail { color: #c0392b; }
+        .pending { color: #7f8c8d; }
+      </style>
     </head>
     <body>
       <h3>📷 Location: {{ location }}</h3>
 
       <div id="reader" style="width:300px"></div>
 
-      <input id="status" placeholder="Status / Quantity" required>
+      <div>Item: <b id="item">-</b></div>
+      <input id="status" placeholder="Quantity" inputmode="numeric" pattern="[0-9]+" required>
       <button onclick="submit()">Submit</button>
+      <label><input id="auto" type="checkbox"> Auto-submit with this quantity</label>
+
+      <div>Queued: <span id="queued">0</span></div>
+      <ul id="log"></ul>
 
       <script>
+        const BATCH_URL = "{{ url_for('scan_batch') }}";
+        const REPEAT_MS = 3000;   // same code again only after this long out of view
+        const RETRY_MS = 2000;   // only when no reply came back at all
+
         let itemId = "";
+        let lastCode = "", lastCodeAt = 0;
+        let queue = [];
+        let sending = false;
+
+        const statusInput = document.getElementById("status");
+
+        function show(entry, text, cls) {
+          entry.li.textContent = text;
+          entry.li.className = cls;
+        }
+
+        function newScanId() {
+          if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+          return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+        }
+
+        function enqueue(id) {
+          const status = statusInput.value.trim();
+          if (!id || !status) {
+            alert("Scan an item and enter the quantity first.");
+            return;
+          }
+          if (!/^[0-9]+$/.test(status)) {
+            alert("Quantity must be a whole number.");
+            return;
+          }
+          const li = document.createElement("li");
+          const log = document.getElementById("log");
+          log.insertBefore(li, log.firstChild);
+          const entry = { scan_id: newScanId(), item_id: id, status: status, li: li };
+          show(entry, `… ${id} × ${status}`, "pending");
+          queue.push(entry);
+          itemId = "";
+          document.getElementById("item").textContent = "-";
+          flush();
+        }
+
+        async function flush() {
+          document.getElementById("queued").textContent = queue.length;
+          if (sending || queue.length === 0) return;
+
+          sending = true;
+          const batch = queue.splice(0, queue.length);
+          let res;
+          try {
+            res = await fetch(BATCH_URL, {
+              method: "POST",
+              headers: {"Content-Type": "application/json"},
+              body: JSON.stringify(batch.map(e => ({ scan_id: e.scan_id, item_id: e.item_id, status: e.status })))
+            });
+          } catch (err) {
+            // No reply, so the scans may or may not be logged. They go again
+            // with the same scan ids and the server skips the ones it has.
+            sending = false;
+            queue = batch.concat(queue);
+            batch.forEach(e => show(e, `⟳ ${e.item_id} × ${e.status} (retrying)`, "pending"));
+            document.getElementById("queued").textContent = queue.length;
+            setTimeout(flush, RETRY_MS);
+            return;
+          }
+
+          try {
+            if (!res.ok) throw new Error(`server error ${res.status}`);
+            const body = await res.json();
+            body.results.forEach((r, i) => {
+              const e = batch[i];
+              if (r.ok) show(e, `✅ ${e.item_id} × ${e.status}`, "ok");
+              else show(e, `❌ ${e.item_id}: ${r.error}`, "fail");
+            });
+          } catch (err) {
+            // The server refused the batch; sending it again would fail the
+            // same way, so it is dropped
+            batch.forEach(e => show(e, `❌ ${e.item_id}: ${err.message}`, "fail"));
+          } finally {
+            sending = false;
+          }
+          // Scans queued while this batch was in flight go out next
+          if (queue.length) flush();
+          document.getElementById("queued").textContent = queue.length;
+        }
+
+        function submit() {
+          enqueue(itemId);
+        }
+
+        statusInput.addEventListener("keydown", ev => {
+          if (ev.key === "Enter") submit();
+        });
 
         const qr = new Html5Qrcode("reader");
         qr.start(
           { facingMode: "environment" },
           { fps: 10, qrbox: 250 },
           decoded => {
+            // The decoder fires ~10x a second while a label is in view, so
+            // every sighting pushes the window on, not just accepted ones
+            const now = Date.now();
+            const repeat = decoded === lastCode && now - lastCodeAt < REPEAT_MS;
+            lastCode = decoded;
+            lastCodeAt = now;
+            if (repeat) return;
+
             itemId = decoded;
+            document.getElementById("item").textContent = decoded;
             if (navigator.vibrate) navigator.vibrate(200);
-            qr.stop();
+            if (document.getElementById("auto").checked) enqueue(decoded);
           }
         );
-
-        async function submit() {
-          await fetch("/scan", {
-            method: "POST",
-            headers: {"Content-Type": "application/json"},
-            body: JSON.stringify({
-              item_id: itemId,
-              status: document.getElementById("status").value
-            })
-          });
-          location.reload();
-        }
       </script>
     </body>
     </html>
     """
 
+    # scan id -> result, oldest first. Requests are logged one at a time so
+    # a resent batch cannot get past the check while the original is still
+    # being written.
+    seen = OrderedDict()
+    scan_lock = threading.Lock()
+
+    def remember(scan_id, result):
+        if scan_id is not None:
+            seen[scan_id] = result
+            while len(seen) > SCAN_IDS_KEPT:
+                seen.popitem(last=False)
+
+    @app.route("/lib/" + QR_LIBRARY)
+    def qr_library():
+        return send_from_directory(STATIC_DIR, QR_LIBRARY, max_age=86400)
+
     @app.route("/")
     def index():
-        return render_template_string(HTML, location=fixed_location)
+        if (STATIC_DIR / QR_LIBRARY).exists():
+            library_url = url_for("qr_library")
+        else:
+            library_url = QR_LIBRARY_CDN
+        return render_template_string(
+            HTML, location=fixed_location, library_url=library_url
+        )
 
     @app.route("/scan", methods=["POST"])
     def scan():
         data = request.get_json(force=True)
-        log_movement(
-            item_id=data["item_id"],
-            location=fixed_location,
-            status=data["status"],
-            model=fixed_model,
-            substance=fixed_substance,
-        )
+        if not isinstance(data, dict) or data.get("status") in (None, ""):
+            return jsonify(ok=False, error="item_id and status are required"), 400
+        scan_id = _scan_id(data)
+        with scan_lock:
+            if scan_id in seen:
+                return jsonify(seen[scan_id])
+            try:
+                item_id = parse_item_id(data.get("item_id"))
+                log_movement(
+                    item_id=item_id,
+                    location=fixed_location,
+                    status=data["status"],
+                    model=fixed_model,
+                    substance=fixed_substance,
+                )
+            except ValueError as e:
+                return jsonify(ok=False, error=str(e)), 400
+            remember(scan_id, {"ok": True})
         return jsonify(ok=True)
 
+    @app.route("/scan/batch", methods=["POST"])
+    def scan_batch():
+        # Body: [{"item_id": ..., "status": ...}, ...] or {"items": [...]}
+        data = request.get_json(force=True)
+        entries = data.get("items", []) if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            return jsonify(ok=False, error="expected a list of items"), 400
+
+        results = [None] * len(entries)
+        with scan_lock:
+            valid = []
+            batch_ids = set()
+            for i, entry in enumerate(entries):
+                if (
+                    not isinstance(entry, dict)
+                    or not entry.get("item_id")
+                    or entry.get("status") in (None, "")
+                ):
+                    results[i] = {"ok": False, "error": "item_id and status are required"}
+                    continue
+                scan_id = _scan_id(entry)
+                if scan_id in seen:
+                    # Already logged; the reply to the first send was lost
+                    results[i] = seen[scan_id]
+                    continue
+                if scan_id in batch_ids:
+                    results[i] = {"ok": False, "error": "scan_id sent twice in one batch"}
+                    continue
+                try:
+                    parse_item_id(entry["item_id"])
+                    parse_quantity(entry["status"])
+                except ValueError as e:
+                    results[i] = {"ok": False, "error": str(e)}
+                    continue
+                if scan_id is not None:
+                    batch_ids.add(scan_id)
+                valid.append(i)
+
+            rows = log_movements(
+                [entries[i] for i in valid],
+                location=fixed_location,
+                model=fixed_model,
+                substance=fixed_substance,
+            )
+            for i, row in zip(valid, rows):
+                results[i] = {"ok": True, "row": row}
+                remember(_scan_id(entries[i]), results[i])
+
+        return jsonify(ok=all(result["ok"] for result in results), results=results)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
     return app
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["fetch-library"]:
+        try:
+            path = fetch_qr_library()
+        except OSError as exc:
+            print(f"❌ Cannot download {QR_LIBRARY_CDN}: {exc}")
+            sys.exit(1)
+        print(f"✅ Saved html5-qrcode {QR_LIBRARY_VERSION} to {path}")
+    else:
+        print("Usage: python scanner_base.py fetch-library")
@@ -0,0 +1,216 @@
+import base64
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from filelock import FileLock
+
+from snapshot import TraceSnapshot
+from storage import DATA_DIR
+
+# ==================================================
+# SHARED SNAPSHOT (SEVERAL DASHBOARD WORKERS)
+# ==================================================
+# With the dashboard running as several worker processes, the parsed live
+# log is published once per log version as an Arrow IPC file that every
+# worker memory-maps, so the log is parsed once instead of in each worker.
+# The first worker to see a new log version takes the publish lock, tails
+# the log from the cursor stored with the current snapshot, writes the next
+# file and swaps the pointer file with os.replace; the others just map
+# whatever the pointer names.
+#
+# What is shared: the text columns (item_id, model, substance), timestamp
+# and status are views into the mapped file, held once in the page cache.
+# Each worker still keeps its own location codes (one int32 per row), its
+# QuantityAggregates and FlowAggregates, and the archive partitions its
+# queries load; those grow with history in every worker.
+SHARED_DIR = DATA_DIR / "snapshot"
+SHARED_DIR.mkdir(parents=True, exist_ok=True)
+
+POINTER_FILE = SHARED_DIR / "current.json"
+PUBLISH_LOCK = SHARED_DIR / "publish.lock"
+SNAPSHOT_PREFIX = "live_"
+SNAPSHOT_SUFFIX = ".arrow"
+
+# Older files are kept a little while for workers still mapping them
+KEEP_FILES = 3
+
+# Fixed file schema, so an empty publish (e.g. right after compaction left
+# only a header) has the same column types as the ones appended to it.
+# large_string is what pandas' Arrow-backed strings use, so the mapped
+# buffers are wrapped as they are instead of being converted.
+ARROW_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns")),
+    ("item_id", pa.large_string()),
+    ("location", pa.dictionary(pa.int32(), pa.large_string())),
+    ("status", pa.int64()),
+    ("model", pa.large_string()),
+    ("substance", pa.large_string()),
+])
+
+# NaN-missing like the object/str columns the storage readers return
+STRING_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)
+
+
+def _dump_cursor(cursor):
+    # The csv cursor carries raw bytes; the sqlite one is a row id
+    if isinstance(cursor, dict):
+        return {**cursor, "tail": base64.b64encode(cursor["tail"]).decode("ascii")}
+    return cursor
+
+
+def _load_cursor(cursor):
+    if isinstance(cursor, dict):
+        return {**cursor, "tail": base64.b64decode(cursor["tail"])}
+    return cursor
+
+
+def read_pointer():
+    try:
+        with open(POINTER_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_pointer(pointer):
+    tmp = POINTER_FILE.with_name(f"{POINTER_FILE.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+    os.replace(tmp, POINTER_FILE)
+
+
+def map_table(name):
+    # Zero-copy: the table's buffers point into the mapped file
+    source = pa.memory_map(str(SHARED_DIR / name), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def _string_types(arrow_type):
+    # Without this, pandas 2.x copies every string into a Python object
+    if arrow_type == pa.large_string():
+        return STRING_DTYPE
+    return None
+
+
+def to_table(df):
+    return pa.Table.from_pandas(
+        df[ARROW_SCHEMA.names], schema=ARROW_SCHEMA, preserve_index=False
+    )
+
+
+def to_frame(table):
+    return table.to_pandas(split_blocks=True, types_mapper=_string_types)
+
+
+def _write_table(table):
+    name = f"{SNAPSHOT_PREFIX}{uuid.uuid4().hex}{SNAPSHOT_SUFFIX}"
+    path = SHARED_DIR / name
+    tmp = path.with_name(f"{name}.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return name
+
+
+def _remove_old_files(current):
+    files = sorted(
+        SHARED_DIR.glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"),
+        key=lambda p: p.stat().st_mtime_ns,
+    )
+    for path in files[:-KEEP_FILES]:
+        if path.name == current:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            # Still mapped (Windows); retried after the next publish
+            pass
+
+# ==================================================
+# PUBLISHER
+# ==================================================
+def publish(storage):
+    # Returns the pointer for the current log version, publishing it first
+    # if no worker has yet
+    with FileLock(str(PUBLISH_LOCK)):
+        pointer = read_pointer()
+        # Read before tailing, so the snapshot holds at least this version
+        version = storage.version()
+        if pointer is not None and pointer["version"] == version:
+            return pointer
+
+        cursor = _load_cursor(pointer["cursor"]) if pointer else None
+        new_rows, cursor, reset = storage.read_since(cursor)
+        new_table = to_table(new_rows)
+
+        previous = None
+        if pointer is not None and not reset and new_table.num_rows:
+            previous = map_table(pointer["file"])
+            if not previous.schema.equals(ARROW_SCHEMA):
+                # Published by an older version; start a new generation
+                new_rows, cursor, _ = storage.read_since(None)
+                new_table = to_table(new_rows)
+                reset = True
+
+        if pointer is None or reset:
+            generation = uuid.uuid4().hex
+            name = _write_table(new_table)
+            rows = new_table.num_rows
+        elif new_table.num_rows == 0:
+            generation, name, rows = pointer["generation"], pointer["file"], pointer["rows"]
+        else:
+            # One contiguous chunk per column, so workers can hand the
+            # buffers to pandas without stitching chunks together
+            table = (
+                pa.concat_tables([previous, new_table])
+                .unify_dictionaries()
+                .combine_chunks()
+            )
+            generation = pointer["generation"]
+            name = _write_table(table)
+            rows = table.num_rows
+
+        pointer = {
+            "version": version,
+            "file": name,
+            "cursor": _dump_cursor(cursor),
+            "generation": generation,
+            "rows": rows,
+        }
+        _write_pointer(pointer)
+        _remove_old_files(name)
+        return pointer
+
+# ==================================================
+# WORKER VIEW
+# ==================================================
+class SharedTraceSnapshot(TraceSnapshot):
+    # Same interface as TraceSnapshot; .df is rebuilt over the mapped file
+    # whenever the pointer moves on. Appends within one generation only
+    # fold the new rows into the aggregates.
+    def __init__(self, storage=None):
+        super().__init__(storage)
+        self._file = None
+        self._generation = None
+
+    def _advance(self):
+        pointer = read_pointer()
+        if pointer is None or pointer["version"] != self.storage.version():
+            pointer = publish(self.storage)
+
+        if pointer["file"] == self._file:
+            return self.df.iloc[:0], False
+
+        df = to_frame(map_table(pointer["file"]))
+        reset = pointer["generation"] != self._generation or len(df) < len(self.df)
+        new_rows = df if reset else df.iloc[len(self.df):]
+
+        self.df = df
+        self._file = pointer["file"]
+        self._generation = pointer["generation"]
+        return new_rows, reset
@@ -11,5 +11,9 @@ while True:
     model = "-"
     substance = "-"
 
-    log = log_movement(item_id, location, status, model, substance)
+    try:
+        log = log_movement(item_id, location, status, model, substance)
+    except ValueError as e:
+        print(f"❌ {e}")
+        continue
     print("Logged:", log)
@@ -0,0 +1,195 @@
+import threading
+
+import metrics
+from aggregates import FlowAggregates, QuantityAggregates
+from archive import ArchiveReader, read_partition
+from storage import concat_frames, empty_frame, filter_frame, get_storage
+
+# ==================================================
+# IN-MEMORY TRACE SNAPSHOT
+# ==================================================
+# Parsed copy of the trace log shared by every dashboard callback. Each
+# refresh only reads and parses what was appended since the last one; the
+# storage backend reports truncation/replacement, and only then is the
+# whole log reloaded. Closed days that were compacted into the daily
+# archive are loaded per query window by the ArchiveReader. Rows arrive
+# already typed from the storage backend.
+#
+# Increments are kept as separate chunks and only concatenated onto the
+# rest when a query needs the whole live log (or once TAIL_CHUNKS_MAX have
+# piled up), so a refresh costs the new rows rather than a copy of the
+# history.
+#
+# Queries without a date range are answered from one frame of archive +
+# live rows that is kept per archive signature and only extended by the
+# rows appended since; date ranges go through the ArchiveReader's windows.
+TAIL_CHUNKS_MAX = 64
+
+
+def _rows_after(chunks, skip):
+    # The chunks' rows past the first `skip`
+    rows = []
+    for chunk in chunks:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        rows.append(chunk.iloc[skip:])
+        skip = 0
+    return rows
+
+
+class TraceSnapshot:
+    def __init__(self, storage=None):
+        self._storage = storage
+        self._lock = threading.Lock()
+        self._chunks_lock = threading.Lock()
+        self._cursor = None
+        self._base = empty_frame()
+        self._tail = []
+        self._rows = 0
+        self._resets = 0
+        self._everything = None
+        self._everything_lock = threading.Lock()
+        self.aggregates = QuantityAggregates()
+        self.flow = FlowAggregates()
+        self.archive = ArchiveReader()
+        self._archive_signature = None
+
+    @property
+    def storage(self):
+        return self._storage or get_storage()
+
+    # ---------- live rows ----------
+    @property
+    def df(self):
+        # The whole live log (rows not yet archived) as one frame
+        with self._chunks_lock:
+            if self._tail:
+                self._base = concat_frames([self._base] + self._tail)
+                self._tail = []
+            return self._base
+
+    @df.setter
+    def df(self, df):
+        with self._chunks_lock:
+            self._base = df
+            self._tail = []
+            self._rows = len(df)
+
+    def chunks(self):
+        with self._chunks_lock:
+            return [self._base] + self._tail
+
+    def _append(self, new_rows):
+        with self._chunks_lock:
+            self._tail.append(new_rows)
+            self._rows += len(new_rows)
+            if len(self._tail) > TAIL_CHUNKS_MAX:
+                # Only the tail is copied, not the history
+                self._tail = [concat_frames(self._tail)]
+
+    # ---------- refresh ----------
+    def refresh(self):
+        with self._lock, metrics.SNAPSHOT_REFRESH_SECONDS.time():
+            new_rows, reset = self._advance()
+            archive_signature = self.archive.signature()
+
+            if reset:
+                self._resets += 1
+            if reset or archive_signature != self._archive_signature:
+                # Partitions are folded in one at a time without keeping
+                # them, so the totals cover all history at little memory
+                aggregates = QuantityAggregates()
+                flow = FlowAggregates()
+                for day, _ in archive_signature:
+                    partition = read_partition(day)
+                    aggregates.add(partition)
+                    flow.add(partition)
+                for chunk in self.chunks():
+                    aggregates.add(chunk)
+                    flow.add(chunk)
+                self.aggregates = aggregates
+                self.flow = flow
+                self._archive_signature = archive_signature
+            elif not new_rows.empty:
+                self.aggregates.add(new_rows)
+                self.flow.add(new_rows)
+
+            metrics.SNAPSHOT_ROWS.set(self._rows)
+
+    def _advance(self):
+        # Brings the live rows up to date; returns (rows added, reset)
+        new_rows, self._cursor, reset = self.storage.read_since(self._cursor)
+
+        if reset:
+            self.df = new_rows
+        elif not new_rows.empty:
+            self._append(new_rows)
+        return new_rows, reset
+
+    def _all_rows(self):
+        # {"frame": archive + live rows, "archived": rows from the archive}
+        signature = self.archive.signature()
+        with self._everything_lock:
+            with self._lock:
+                chunks = self.chunks()
+                resets, rows = self._resets, self._rows
+
+            everything = self._everything
+            if (
+                everything is not None
+                and everything["signature"] == signature
+                and everything["resets"] == resets
+            ):
+                if everything["rows"] == rows:
+                    return everything
+                archived = everything["archived"]
+                frames = [everything["frame"]] + _rows_after(chunks, everything["rows"])
+            else:
+                partitions = [read_partition(day) for day, _ in signature]
+                archived = sum(len(partition) for partition in partitions)
+                frames = partitions + chunks
+
+            self._everything = {
+                "signature": signature,
+                "resets": resets,
+                "rows": rows,
+                "archived": archived,
+                "frame": concat_frames(frames),
+            }
+            return self._everything
+
+    # ---------- queries ----------
+    def live(self, item_id=None, model=None, start_date=None, end_date=None):
+        # Live (not yet archived) rows matching the dashboard filters. A
+        # backend with indexes answers filtered reads itself; the snapshot
+        # is still refreshed so the aggregates stay current.
+        self.refresh()
+        if not (item_id or model or start_date or end_date):
+            return self.df
+
+        storage = self.storage
+        if storage.INDEXED_QUERIES:
+            return storage.query(item_id, model, start_date, end_date)
+        return concat_frames([
+            filter_frame(chunk, item_id, model, start_date, end_date)
+            for chunk in self.chunks()
+        ])
+
+    def query(self, item_id=None, model=None, start_date=None, end_date=None):
+        if not (start_date or end_date):
+            if not (item_id or model):
+                self.refresh()
+                return self._all_rows()["frame"]
+            live = self.live(item_id, model)
+            everything = self._all_rows()
+            archived = everything["frame"].iloc[:everything["archived"]]
+            return concat_frames([filter_frame(archived, item_id, model), live])
+
+        live = self.live(item_id, model, start_date, end_date)
+        archive = self.archive.frame(start_date, end_date)
+        if archive is None:
+            return live
+
+        archived = filter_frame(archive, item_id, model, start_date, end_date)
+        return concat_frames([archived, live])
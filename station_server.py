@@ -0,0 +1,105 @@
+from pathlib import Path
+import sys
+
+from cheroot import wsgi
+from cheroot.ssl.builtin import BuiltinSSLAdapter
+from flask import Flask, render_template_string
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.serving import make_ssl_devcert
+
+import tracker
+from fg_web import app as fg_app
+from incoming_web import app as incoming_app
+from office_web import app as office_app
+from qc_web import app as qc_app
+from shipment_web import app as shipment_app
+
+# ==========================
+# EXE-SAFE BASE DIRECTORY
+# ==========================
+def get_base_dir():
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent
+
+BASE_DIR = get_base_dir()
+
+SSL_DIR = BASE_DIR / "srv" / "ssl"
+SSL_DIR.mkdir(parents=True, exist_ok=True)
+
+# ==========================
+# CONSTANTS
+# ==========================
+HOST = "0.0.0.0"
+PORT = 5443
+THREADS = 64
+
+# One process serves every station under its own prefix, e.g.
+# https://<host>:5443/qc/ is the QC scanner page
+STATIONS = {
+    "/office": office_app,
+    "/incoming": incoming_app,
+    "/qc": qc_app,
+    "/fg": fg_app,
+    "/shipment": shipment_app,
+}
+
+# ==========================
+# STATION INDEX
+# ==========================
+index_app = Flask(__name__)
+
+INDEX_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>Stations</title>
+</head>
+<body>
+  <h3>📷 Stations</h3>
+  <ul>
+  {% for prefix in prefixes %}
+    <li><a href="{{ prefix }}/">{{ prefix[1:] | upper }}</a></li>
+  {% endfor %}
+  </ul>
+</body>
+</html>
+"""
+
+
+@index_app.route("/")
+def index():
+    return render_template_string(INDEX_HTML, prefixes=list(STATIONS))
+
+
+app = DispatcherMiddleware(index_app, STATIONS)
+
+# ==========================
+# TLS
+# ==========================
+def ssl_files():
+    # Self-signed pair generated once and reused, like ssl_context="adhoc"
+    # but without a new certificate on every start
+    base = SSL_DIR / "station"
+    cert, key = Path(f"{base}.crt"), Path(f"{base}.key")
+    if not (cert.exists() and key.exists()):
+        make_ssl_devcert(str(base), host="*")
+    return str(cert), str(key)
+
+# ==========================
+# START SERVER
+# ==========================
+if __name__ == "__main__":
+    # All stations share one writer thread, which group-commits scans that
+    # arrive together
+    tracker.enable_write_behind("committed")
+
+    server = wsgi.Server((HOST, PORT), app, numthreads=THREADS)
+    server.ssl_adapter = BuiltinSSLAdapter(*ssl_files())
+
+    print(f"Serving {', '.join(STATIONS)} on https://{HOST}:{PORT}")
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        server.stop()
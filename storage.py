@@ -0,0 +1,830 @@
+from datetime import datetime
+from pathlib import Path
+import atexit
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from filelock import FileLock
+
+import metrics
+
+# pandas is only imported inside the read, rebuild and migration paths, so
+# station CLIs that just append rows start without loading it.
+
+# ==========================
+# EXE-SAFE BASE DIRECTORY
+# ==========================
+def get_base_dir():
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent
+
+BASE_DIR = get_base_dir()
+
+DATA_DIR = BASE_DIR / "srv" / "data"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+TRACE_LOG = DATA_DIR / "trace_log.csv"
+TRACE_DB = DATA_DIR / "trace_log.db"
+
+# ==========================
+# CONSTANTS
+# ==========================
+# "csv" (default) or "sqlite". Every station and the dashboard must agree;
+# switch only after running `python storage.py migrate`.
+BACKEND = "csv"
+
+SOURCE_LOCATION = "Office"
+
+COLUMNS = [
+    "timestamp",
+    "item_id",
+    "location",
+    "status",
+    "model",
+    "substance",
+    "epoch",
+]
+
+# Header of logs written before the typed schema; see _upgrade_schema
+LEGACY_COLUMNS = COLUMNS[:-1]
+
+# ==========================
+# TYPED SCHEMA
+# ==========================
+# status holds the quantity and is always a whole number >= 0. epoch is the
+# timestamp as int64 seconds since 1970-01-01 on the same local wall clock
+# as the display string, so readers turn it back into the identical naive
+# datetime without parsing text.
+_EPOCH = datetime(1970, 1, 1)
+
+# Read dtypes; typed_frame() replaces timestamp with one built from epoch
+CSV_DTYPES = {
+    "timestamp": str,
+    "item_id": str,
+    "location": "category",
+    "status": "int64",
+    "model": str,
+    "substance": str,
+    "epoch": "int64",
+}
+
+
+def parse_quantity(value):
+    text = str(value).strip()
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError(f"quantity must be a whole number, got {value!r}")
+    return int(text)
+
+
+def parse_item_id(value):
+    # Item IDs key the item index and the dashboard lookups; anything but
+    # non-empty text (e.g. a JSON list from a web client) is refused
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"item_id must be non-empty text, got {value!r}")
+    return value
+
+
+def to_epoch(dt):
+    return int((dt - _EPOCH).total_seconds())
+
+
+def _legacy_epoch(timestamp):
+    try:
+        return to_epoch(datetime.fromisoformat(timestamp))
+    except (TypeError, ValueError):
+        return ""
+
+
+def _row_values(row):
+    # Values in COLUMNS order. Rows from the tracker carry no epoch (the
+    # row handed back to callers keeps its old keys); it is derived from
+    # the timestamp here.
+    if row.get("epoch") is None:
+        row = {**row, "epoch": _legacy_epoch(row["timestamp"])}
+    return [row[c] for c in COLUMNS]
+
+
+def typed_frame(df):
+    # Frame read with CSV_DTYPES -> dashboard frame (datetime timestamp,
+    # no epoch column)
+    import pandas as pd
+
+    return df.assign(
+        timestamp=pd.to_datetime(df["epoch"], unit="s"),
+    ).drop(columns="epoch")
+
+
+def coerce_frame(df):
+    # Slow path for rows that do not fit the schema (a log not upgraded
+    # yet, or rows from a station still on the old version): string
+    # columns in, the same dtypes as typed_frame out
+    import pandas as pd
+
+    df = df.reindex(columns=COLUMNS)
+    epoch = pd.to_numeric(df["epoch"], errors="coerce")
+    missing = epoch.isna()
+    if missing.any():
+        parsed = pd.to_datetime(df.loc[missing, "timestamp"], errors="coerce")
+        epoch[missing] = (parsed - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+    return df.assign(
+        timestamp=pd.to_datetime(epoch, unit="s"),
+        location=df["location"].astype("category"),
+        status=pd.to_numeric(df["status"], errors="coerce").fillna(0).astype("int64"),
+    ).drop(columns="epoch")
+
+
+def empty_frame():
+    import pandas as pd
+
+    return typed_frame(pd.DataFrame({
+        column: pd.Series(dtype=dtype) for column, dtype in CSV_DTYPES.items()
+    }))
+
+# ==========================
+# QUERY HELPERS
+# ==========================
+def _date_bounds(start_date=None, end_date=None):
+    # Same window as the dashboard date pickers: from the start of
+    # start_date up to and including midnight after end_date.
+    import pandas as pd
+
+    lower = upper = None
+    if start_date:
+        lower = pd.to_datetime(start_date)
+    if end_date:
+        upper = pd.to_datetime(end_date) + pd.Timedelta(days=1)
+    return lower, upper
+
+
+def filter_frame(df, item_id=None, model=None, start_date=None, end_date=None):
+    import pandas as pd
+
+    lower, upper = _date_bounds(start_date, end_date)
+    if lower is not None or upper is not None:
+        ts = df["timestamp"]
+        if not pd.api.types.is_datetime64_any_dtype(ts):
+            ts = pd.to_datetime(ts, errors="coerce")
+        mask = pd.Series(True, index=df.index)
+        if lower is not None:
+            mask &= ts >= lower
+        if upper is not None:
+            mask &= ts <= upper
+        df = df[mask]
+
+    # Item ID > Model > All
+    if item_id:
+        df = df[df["item_id"] == item_id]
+    elif model:
+        df = df[df["model"] == model]
+
+    return df
+
+def concat_frames(frames):
+    # pd.concat for typed frames that keeps categorical columns categorical
+    # (pd.concat falls back to object as soon as the categories differ) and
+    # leaves out empty frames. Every frame is cast to the union of the
+    # categories first, so the codes are concatenated as they are.
+    import pandas as pd
+
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+
+    dtypes = {}
+    for column in frames[0].columns:
+        if not any(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            continue
+        # Object categories, so Arrow-backed and plain strings unify
+        values = [
+            df[column].cat.categories if isinstance(df[column].dtype, pd.CategoricalDtype)
+            else pd.Index(df[column].unique())
+            for df in frames
+        ]
+        categories = values[0].astype(object).append(
+            [v.astype(object) for v in values[1:]]
+        ).unique().sort_values()
+        dtypes[column] = pd.CategoricalDtype(categories)
+
+    frames = [
+        df.astype({c: t for c, t in dtypes.items() if df[c].dtype != t})
+        if any(df[c].dtype != t for c, t in dtypes.items()) else df
+        for df in frames
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+# ==========================
+# CSV BACKEND
+# ==========================
+class CsvStorage:
+    # Append-only CSV guarded by a FileLock, with a persistent item index
+    # (item_id -> [timestamp, model, substance] of its latest Office row) so
+    # the inheritance rule is a dict lookup instead of a scan of the log.
+    # The index remembers the inode and byte offset of the log it covers;
+    # anything appended past that offset (by this or another station) is
+    # folded in on the next sync, and a log that shrank or was replaced
+    # triggers a full rebuild.
+    INDEX_FLUSH_EVERY = 500
+
+    # A filtered read still has to parse the whole file, so the dashboard
+    # filters its in-memory snapshot instead
+    INDEXED_QUERIES = False
+
+    def __init__(self, path=TRACE_LOG):
+        self.path = Path(path)
+        self.lock_file = self.path.with_suffix(".lock")
+        self.index_file = self.path.with_suffix(".index.json")
+        self._index = None
+        self._unsaved = 0
+        self._schema_ok = False
+        atexit.register(self._save_index)
+
+    # ---------- write path ----------
+    def transaction(self):
+        return _CsvTransaction(self)
+
+    def _encode_rows(self, rows, header=False):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if header:
+            writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(_row_values(row))
+        return buf.getvalue().encode("utf-8")
+
+    def _append_rows(self, rows):
+        # Caller must hold the lock. One write + fsync per call, so the cost
+        # does not depend on how much history is already in the log.
+        with open(self.path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            data = self._encode_rows(rows, header=size == 0)
+
+            # Terminate a torn last line left behind by an interrupted write
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return os.fstat(f.fileno())
+
+    def _upgrade_schema(self):
+        # Caller must hold the lock and have synced the index. A log that
+        # still has the pre-typed header is rewritten once with epoch
+        # filled in and quantities normalised; one that does not parse
+        # becomes 0, which is what the dashboard always counted it as.
+        if self._schema_ok:
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                header = next(csv.reader([f.readline()]), [])
+        except FileNotFoundError:
+            header = COLUMNS
+
+        if header == LEGACY_COLUMNS:
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(self.path, "r", encoding="utf-8", newline="") as src, \
+                    open(tmp, "w", encoding="utf-8", newline="") as dst:
+                reader = csv.reader(src)
+                writer = csv.writer(dst, lineterminator="\n")
+                next(reader)
+                writer.writerow(COLUMNS)
+                for fields in reader:
+                    if len(fields) == len(LEGACY_COLUMNS):
+                        row = dict(zip(LEGACY_COLUMNS, fields))
+                        try:
+                            row["status"] = parse_quantity(row["status"])
+                        except ValueError:
+                            row["status"] = 0
+                        row["epoch"] = _legacy_epoch(row["timestamp"])
+                        fields = [row[c] for c in COLUMNS]
+                    writer.writerow(fields)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+
+            # Same rows, new file: hand the index over like compaction does
+            stat = self.path.stat()
+            self._index["inode"] = stat.st_ino
+            self._index["offset"] = stat.st_size
+            self._save_index()
+
+        self._schema_ok = True
+
+    # ---------- item index ----------
+    @staticmethod
+    def _empty_index():
+        return {"inode": None, "offset": 0, "rows": 0, "items": {}}
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if set(data) != set(self._empty_index()):
+                raise ValueError("unexpected index layout")
+            return data
+        except (OSError, ValueError):
+            return self._empty_index()
+
+    def _save_index(self):
+        if self._index is None:
+            return
+
+        tmp = self.index_file.with_name(
+            f"{self.index_file.name}.{os.getpid()}.tmp"
+        )
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.index_file)
+        self._unsaved = 0
+
+    def _index_rows(self, rows):
+        index = self._index
+        items = index["items"]
+
+        for row in rows:
+            index["rows"] += 1
+            self._unsaved += 1
+            if row["location"] != SOURCE_LOCATION:
+                continue
+            latest = items.get(row["item_id"])
+            if latest is None or row["timestamp"] >= latest[0]:
+                items[row["item_id"]] = [
+                    row["timestamp"], row["model"], row["substance"]
+                ]
+
+    def _seed_index(self):
+        # A rebuilt index starts from the Office rows already rolled out
+        # into the daily archive
+        import pandas as pd
+        from archive import partition_days, read_partition
+
+        for day in partition_days():
+            office = read_partition(
+                day,
+                columns=["timestamp", "item_id", "location", "model", "substance"],
+                filters=[("location", "==", SOURCE_LOCATION)],
+            )
+            office = office.sort_values("timestamp", kind="stable")
+            self._index_rows(
+                {
+                    "timestamp": ts.isoformat(timespec="seconds"),
+                    "item_id": item_id,
+                    "location": SOURCE_LOCATION,
+                    "model": model,
+                    "substance": substance,
+                }
+                for ts, item_id, model, substance in zip(
+                    office["timestamp"], office["item_id"],
+                    office["model"], office["substance"],
+                )
+                if not pd.isna(ts)
+            )
+
+    def _sync_index(self):
+        # Caller must hold the lock.
+        if self._index is None:
+            self._index = self._load_index()
+
+        try:
+            stat = self.path.stat()
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+
+        if self._index["inode"] != inode or self._index["offset"] > size:
+            # The log was replaced (e.g. by archive compaction, which hands
+            # its index over through the sidecar) or truncated
+            self._index = self._load_index()
+            if self._index["inode"] != inode or self._index["offset"] > size:
+                self._index = self._empty_index()
+                self._index["inode"] = inode
+                self._seed_index()
+            self._unsaved = self.INDEX_FLUSH_EVERY
+
+        offset = self._index["offset"]
+        if offset < size:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+
+            # Only consume complete lines
+            data = data[: data.rfind(b"\n") + 1]
+            lines = data.decode("utf-8").splitlines()
+            if offset == 0 and lines:
+                lines = lines[1:]
+
+            self._index_rows(
+                dict(zip(COLUMNS, fields))
+                for fields in csv.reader(lines)
+                if len(fields) in (len(COLUMNS), len(LEGACY_COLUMNS))
+            )
+            self._index["offset"] += len(data)
+
+        if self._unsaved >= self.INDEX_FLUSH_EVERY:
+            self._save_index()
+
+    # ---------- read path ----------
+    # Bytes kept from just before a read_since() cursor, re-checked on the
+    # next call to catch a log rewritten in place to the same or larger size
+    TAIL_CHECK = 64
+
+    def exists(self):
+        return self.path.exists()
+
+    def version(self):
+        # Changes whenever the log is appended to, truncated or replaced
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def read_since(self, cursor=None):
+        # Returns (rows appended after cursor, new cursor, reset). reset is
+        # True when the log was truncated or replaced and the returned rows
+        # are the whole log rather than an increment.
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return empty_frame(), None, cursor is not None
+
+        with open(self.path, "rb") as f:
+            reset = (
+                cursor is None
+                or cursor["inode"] != stat.st_ino
+                or cursor["offset"] > stat.st_size
+            )
+            if not reset and cursor["tail"]:
+                f.seek(cursor["offset"] - len(cursor["tail"]))
+                reset = f.read(len(cursor["tail"])) != cursor["tail"]
+
+            offset = 0 if reset else cursor["offset"]
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+
+        # Only consume complete lines
+        data = data[: data.rfind(b"\n") + 1]
+        tail = b"" if reset else cursor["tail"]
+        cursor = {
+            "inode": stat.st_ino,
+            "offset": offset + len(data),
+            "tail": (tail + data)[-self.TAIL_CHECK:],
+        }
+        return self._parse(data, header=offset == 0), cursor, reset
+
+    @staticmethod
+    def _parse(data, header):
+        import pandas as pd
+
+        if not data.strip():
+            return empty_frame()
+
+        names = {} if header else {"header": None, "names": COLUMNS}
+        try:
+            df = pd.read_csv(io.BytesIO(data), dtype=CSV_DTYPES, **names)
+            return typed_frame(df)
+        except (KeyError, ValueError):
+            df = pd.read_csv(io.BytesIO(data), dtype=str, **names)
+            return coerce_frame(df)
+
+
+class _CsvTransaction:
+    def __init__(self, storage):
+        self.storage = storage
+        self.rows = []
+        self._lock = FileLock(str(storage.lock_file))
+
+    def __enter__(self):
+        with metrics.LOCK_WAIT_SECONDS.time():
+            self._lock.acquire()
+        try:
+            with metrics.READ_SECONDS.time():
+                self.storage._sync_index()
+            self.storage._upgrade_schema()
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        storage = self.storage
+        committed = False
+        try:
+            if exc_type is None and self.rows:
+                with metrics.WRITE_SECONDS.time():
+                    stat = storage._append_rows(self.rows)
+                storage._index["inode"] = stat.st_ino
+                storage._index["offset"] = stat.st_size
+                if storage._unsaved >= storage.INDEX_FLUSH_EVERY:
+                    storage._save_index()
+
+                metrics.ROWS_WRITTEN.inc(len(self.rows))
+                metrics.LOG_ROWS.set(storage._index["rows"])
+                metrics.LOG_BYTES.set(stat.st_size)
+            committed = exc_type is None
+        finally:
+            if not committed:
+                # The in-memory index may now be ahead of the file; reload it
+                storage._index = None
+            self._lock.release()
+
+    def has_rows(self):
+        return self.storage._index["rows"] > 0
+
+    def latest_office(self, item_id):
+        latest = self.storage._index["items"].get(item_id)
+        if latest is None:
+            return None
+        return {"model": latest[1], "substance": latest[2]}
+
+    def add(self, row):
+        # Indexed immediately so an Office row earlier in the same
+        # transaction is visible to the rows after it.
+        self.storage._index_rows([row])
+        self.rows.append(row)
+
+# ==========================
+# SQLITE BACKEND
+# ==========================
+class SqliteStorage:
+    # One table in WAL mode with indexes for the lookups the tracker and
+    # the dashboard make, so they touch only the matching rows.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trace_log (
+            id        INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            item_id   TEXT NOT NULL,
+            location  TEXT NOT NULL,
+            status    TEXT,
+            model     TEXT,
+            substance TEXT,
+            epoch     INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_trace_item
+            ON trace_log (item_id, location, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_trace_model ON trace_log (model);
+        CREATE INDEX IF NOT EXISTS idx_trace_location ON trace_log (location);
+        CREATE INDEX IF NOT EXISTS idx_trace_timestamp ON trace_log (timestamp);
+    """
+
+    # Rows from before the epoch column (or from an old station) get it
+    # from the timestamp text
+    BACKFILL_EPOCH = """
+        UPDATE trace_log SET epoch = CAST(strftime('%s', timestamp) AS INTEGER)
+        WHERE epoch IS NULL
+    """
+
+    # Item, model and date filters are answered by the indexes below
+    # (query()), so the dashboard sends them here instead of scanning its
+    # snapshot
+    INDEXED_QUERIES = True
+
+    # Typed read columns: a quantity that is not a number reads as 0
+    SELECT_COLUMNS = (
+        "timestamp, item_id, location,"
+        " COALESCE(CAST(status AS INTEGER), 0) AS status, model, substance,"
+        " COALESCE(epoch, CAST(strftime('%s', timestamp) AS INTEGER)) AS epoch"
+    )
+
+    def __init__(self, path=TRACE_DB):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self.path), timeout=30, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(self.SCHEMA)
+            self._upgrade_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _upgrade_schema(self, conn):
+        # One-time ALTER for databases created before the typed schema
+        def has_epoch():
+            return any(
+                row[1] == "epoch"
+                for row in conn.execute("PRAGMA table_info(trace_log)")
+            )
+
+        if has_epoch():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not has_epoch():
+                conn.execute("ALTER TABLE trace_log ADD COLUMN epoch INTEGER")
+                conn.execute(self.BACKFILL_EPOCH)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _typed(self, df):
+        return typed_frame(df.astype({"location": "category", "status": "int64"}))
+
+    # ---------- write path ----------
+    def transaction(self):
+        return _SqliteTransaction(self)
+
+    # ---------- read path ----------
+    def exists(self):
+        return self.path.exists()
+
+    def version(self):
+        # Rows are only ever inserted, so the last row id identifies the
+        # contents; the inode catches a replaced database file.
+        if not self.path.exists():
+            return None
+        last_id = self.connect().execute("SELECT MAX(id) FROM trace_log").fetchone()[0]
+        return f"{self.path.stat().st_ino}:{last_id or 0}"
+
+    def query(self, item_id=None, model=None, start_date=None, end_date=None):
+        import pandas as pd
+
+        where, params = [], []
+
+        lower, upper = _date_bounds(start_date, end_date)
+        if lower is not None:
+            where.append("timestamp >= ?")
+            params.append(lower.isoformat(timespec="seconds"))
+        if upper is not None:
+            where.append("timestamp <= ?")
+            params.append(upper.isoformat(timespec="seconds"))
+
+        # Item ID > Model > All
+        if item_id:
+            where.append("item_id = ?")
+            params.append(item_id)
+        elif model:
+            where.append("model = ?")
+            params.append(model)
+
+        sql = f"SELECT {self.SELECT_COLUMNS} FROM trace_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+
+        return self._typed(pd.read_sql_query(sql, self.connect(), params=params))
+
+    def read_since(self, cursor=None):
+        # Same contract as CsvStorage.read_since; the cursor is the last
+        # row id seen.
+        import pandas as pd
+
+        conn = self.connect()
+        last_id = conn.execute("SELECT MAX(id) FROM trace_log").fetchone()[0] or 0
+
+        reset = cursor is None or cursor > last_id
+        if reset:
+            cursor = 0
+
+        df = pd.read_sql_query(
+            f"SELECT id, {self.SELECT_COLUMNS} FROM trace_log"
+            " WHERE id > ? ORDER BY id",
+            conn,
+            params=[cursor],
+        )
+        if not df.empty:
+            cursor = int(df["id"].iloc[-1])
+        return self._typed(df.drop(columns="id")), cursor, reset
+
+
+class _SqliteTransaction:
+    def __init__(self, storage):
+        self.storage = storage
+        self.conn = storage.connect()
+        self.added = 0
+
+    def __enter__(self):
+        # IMMEDIATE takes the write lock up front so the inheritance
+        # lookups and the inserts see one consistent state.
+        with metrics.LOCK_WAIT_SECONDS.time():
+            self.conn.execute("BEGIN IMMEDIATE")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._rollback()
+            return
+
+        try:
+            with metrics.WRITE_SECONDS.time():
+                self.conn.execute("COMMIT")
+        except BaseException:
+            # A failed COMMIT (SQLITE_BUSY, disk full) leaves the transaction
+            # open on this thread's connection, and every later BEGIN on it
+            # would fail
+            self._rollback()
+            raise
+
+        if self.added:
+            metrics.ROWS_WRITTEN.inc(self.added)
+            metrics.LOG_ROWS.set(self.last_id)
+            metrics.LOG_BYTES.set(self.storage.path.stat().st_size)
+
+    def _rollback(self):
+        # SQLite may already have rolled back on its own (e.g. on a full disk)
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def has_rows(self):
+        return self.conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM trace_log)"
+        ).fetchone()[0] == 1
+
+    def latest_office(self, item_id):
+        found = self.conn.execute(
+            "SELECT model, substance FROM trace_log"
+            " WHERE item_id = ? AND location = ?"
+            " ORDER BY timestamp DESC, id DESC LIMIT 1",
+            (item_id, SOURCE_LOCATION),
+        ).fetchone()
+        if found is None:
+            return None
+        return {"model": found[0], "substance": found[1]}
+
+    def add(self, row):
+        cursor = self.conn.execute(
+            f"INSERT INTO trace_log ({', '.join(COLUMNS)})"
+            f" VALUES ({', '.join('?' * len(COLUMNS))})",
+            _row_values(row),
+        )
+        self.added += 1
+        self.last_id = cursor.lastrowid
+
+# ==========================
+# BACKEND SELECTION
+# ==========================
+BACKENDS = {
+    "csv": CsvStorage,
+    "sqlite": SqliteStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = BACKENDS[BACKEND]()
+        return _storage
+
+# ==========================
+# ONE-SHOT MIGRATION
+# ==========================
+def migrate_csv_to_sqlite(csv_path=TRACE_LOG, db_path=TRACE_DB, chunksize=50_000):
+    import pandas as pd
+
+    db = SqliteStorage(db_path)
+    conn = db.connect()
+
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM trace_log)").fetchone()[0]:
+        raise RuntimeError(f"{db_path} already contains trace rows")
+
+    migrated = 0
+    with FileLock(str(Path(csv_path).with_suffix(".lock"))):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for chunk in pd.read_csv(
+                csv_path, dtype=str, keep_default_na=False, chunksize=chunksize
+            ):
+                # A log not upgraded yet has no epoch column
+                chunk = chunk.reindex(columns=COLUMNS, fill_value=None)
+                conn.executemany(
+                    f"INSERT INTO trace_log ({', '.join(COLUMNS)})"
+                    f" VALUES ({', '.join('?' * len(COLUMNS))})",
+                    chunk.itertuples(index=False, name=None),
+                )
+                migrated += len(chunk)
+            conn.execute(db.BACKFILL_EPOCH)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    return migrated
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        count = migrate_csv_to_sqlite()
+        print(f"✅ Migrated {count} rows from {TRACE_LOG} to {TRACE_DB}")
+        print('Set BACKEND = "sqlite" in storage.py to start using it.')
+    else:
+        print("Usage: python storage.py migrate")
@@ -1,33 +1,228 @@
-
-from pathlib import Path
 from datetime import datetime
-import pandas as pd
+import atexit
+import json
+import os
+import queue
+import socket
 import sys
-from filelock import FileLock
+import threading
+import time
+
+import metrics
+from storage import SOURCE_LOCATION, get_storage, parse_item_id, parse_quantity
 
 # ==========================
-# EXE-SAFE BASE DIRECTORY
+# COMMIT
 # ==========================
-def get_base_dir():
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).resolve().parent
-    return Path(__file__).resolve().parent
+def _inherit(row, txn):
+    # ==================================================
+    # OFFICE-BASED INHERITANCE RULE
+    # ==================================================
+    if row["location"] != SOURCE_LOCATION and txn.has_rows():
+        latest_office = txn.latest_office(row["item_id"])
+
+        if latest_office is not None:
+            row["model"] = latest_office["model"]
+            row["substance"] = latest_office["substance"]
+        else:
+            row["model"] = "-"
+            row["substance"] = "-"
 
-BASE_DIR = get_base_dir()
 
-TRACE_LOG = BASE_DIR / "srv" / "data" / "trace_log.csv"
-TRACE_LOG.parent.mkdir(parents=True, exist_ok=True)
+def _commit(rows):
+    # Resolve and write rows in a single storage transaction.
+    with metrics.COMMIT_SECONDS.time():
+        with get_storage().transaction() as txn:
+            for row in rows:
+                with metrics.INHERIT_SECONDS.time():
+                    _inherit(row, txn)
+                txn.add(row)
 
-LOCK_FILE = TRACE_LOG.with_suffix(".lock")
+    return rows
 
 # ==========================
-# CONSTANTS
+# WRITE-BEHIND QUEUE
 # ==========================
-SOURCE_LOCATION = "Office"
+# When enabled, callers hand their rows to a single writer thread which
+# drains whatever has queued up and commits it as one group. DURABILITY
+# controls when the caller gets control back:
+#   "committed" - after its rows are fsynced (same guarantee as direct mode)
+#   "enqueued"  - as soon as the rows are queued; model/substance in the
+#                 returned row are filled in once the writer commits it
+WRITE_BEHIND = False
+DURABILITY = "committed"
+GROUP_COMMIT_MAX = 500
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def enable_write_behind(durability: str = "committed"):
+    global WRITE_BEHIND, DURABILITY
+    if durability not in ("committed", "enqueued"):
+        raise ValueError(f"unknown durability: {durability!r}")
+    DURABILITY = durability
+    WRITE_BEHIND = True
+    _start_writer()
+
+
+def flush():
+    # Block until everything queued so far has been committed.
+    if _writer is not None:
+        _queue.join()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_writer_loop, name="trace-log-writer", daemon=True
+            )
+            _writer.start()
+            atexit.register(_stop_writer)
+
+
+def _stop_writer():
+    _queue.put(None)
+    _writer.join()
+
+
+def _commit_group(jobs):
+    try:
+        _commit([row for rows, _ in jobs for row in rows])
+        return
+    except BaseException as exc:
+        if len(jobs) == 1:
+            failures = [(jobs[0], exc)]
+        else:
+            # Nothing of the group was written. One caller's bad row must
+            # not fail the others, so each job is retried on its own and
+            # only the ones that still fail get an error.
+            failures = []
+            for job in jobs:
+                try:
+                    _commit(job[0])
+                except BaseException as job_exc:
+                    failures.append((job, job_exc))
+
+    for (rows, pending), exc in failures:
+        pending["error"] = exc
+        if DURABILITY == "enqueued":
+            print(f"trace log writer: failed to commit {len(rows)} row(s): {exc!r}",
+                  file=sys.stderr)
+
+
+def _writer_loop():
+    stop = False
+    while not stop:
+        group = [_queue.get()]
+        size = len(group[0][0]) if group[0] else 0
+
+        while size < GROUP_COMMIT_MAX:
+            try:
+                job = _queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(job)
+            size += len(job[0]) if job else 0
+
+        if None in group:
+            stop = True
+        jobs = [job for job in group if job is not None]
+
+        try:
+            if jobs:
+                _commit_group(jobs)
+        finally:
+            for job in jobs:
+                job[1]["done"].set()
+            for _ in group:
+                _queue.task_done()
+
+
+# ==========================
+# INGEST DAEMON CLIENT
+# ==========================
+# With USE_INGEST_DAEMON on, rows are sent to ingest_server.py, a single
+# writer process shared by every station on the PC, instead of being
+# written here. If the daemon cannot be reached the rows are written
+# directly and the daemon is tried again after INGEST_RETRY_SECONDS. A
+# daemon that took the rows but never answered raises ConnectionError
+# rather than writing them a second time.
+#
+# Switched on per PC without rebuilding the station exes by setting the
+# TRACE_INGEST_DAEMON=1 environment variable (e.g. setx on Windows).
+USE_INGEST_DAEMON = os.environ.get("TRACE_INGEST_DAEMON", "") not in ("", "0")
+INGEST_ADDRESS = ("127.0.0.1", 5544)
+INGEST_TIMEOUT = 30
+INGEST_RETRY_SECONDS = 30
+
+_ingest_down_until = 0.0
+
+
+def _send_to_daemon(rows):
+    # Returns the committed rows, or None when the daemon is unavailable
+    global _ingest_down_until
+    if time.monotonic() < _ingest_down_until:
+        return None
+
+    request = (json.dumps({"rows": rows}) + "\n").encode("utf-8")
+    try:
+        conn = socket.create_connection(INGEST_ADDRESS, timeout=INGEST_TIMEOUT)
+    except OSError:
+        _ingest_down_until = time.monotonic() + INGEST_RETRY_SECONDS
+        metrics.INGEST_FALLBACKS.inc()
+        return None
+
+    with conn, conn.makefile("rb") as reply_file:
+        try:
+            conn.sendall(request)
+            reply = reply_file.readline()
+        except OSError as exc:
+            raise ConnectionError(f"ingest daemon did not confirm the write: {exc}") from exc
+    if not reply:
+        raise ConnectionError("ingest daemon closed the connection before confirming the write")
+
+    reply = json.loads(reply)
+    if not reply["ok"]:
+        if reply.get("error_type") == "ValueError":
+            raise ValueError(reply["error"])
+        raise RuntimeError(f"ingest daemon: {reply['error']}")
+    return reply["rows"]
+
+
+def _submit(rows):
+    if USE_INGEST_DAEMON:
+        committed = _send_to_daemon(rows)
+        if committed is not None:
+            return committed
+
+    if not WRITE_BEHIND:
+        return _commit(rows)
+
+    _start_writer()
+    pending = {"done": threading.Event(), "error": None}
+    _queue.put((rows, pending))
+
+    if DURABILITY == "committed":
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+    return rows
 
 # ==========================
 # LOG MOVEMENT
 # ==========================
+# status is the quantity; anything but a whole number (or an item_id that
+# is not text) raises ValueError before the row gets anywhere near the log.
+# The returned rows have the same keys as before the typed schema; storage
+# adds epoch when writing them.
+def _now():
+    return datetime.now().replace(microsecond=0).isoformat()
+
+
 def log_movement(
     item_id: str,
     location: str,
@@ -35,58 +230,47 @@ def log_movement(
     model: str,
     substance: str,
 ):
-    timestamp = datetime.now().isoformat(timespec="seconds")
+    parse_item_id(item_id)
+    quantity = parse_quantity(status)
+    timestamp = _now()
 
-    with FileLock(str(LOCK_FILE)):
+    row = {
+        "timestamp": timestamp,
+        "item_id": item_id,
+        "location": location,
+        "status": quantity,
+        "model": model,
+        "substance": substance,
+    }
 
-        if TRACE_LOG.exists():
-            df = pd.read_csv(TRACE_LOG)
-        else:
-            df = pd.DataFrame(
-                columns=[
-                    "timestamp",
-                    "item_id",
-                    "location",
-                    "status",
-                    "model",
-                    "substance",
-                ]
-            )
+    return _submit([row])[0]
 
-        # ==================================================
-        # OFFICE-BASED INHERITANCE RULE
-        # ==================================================
-        if location != SOURCE_LOCATION and not df.empty:
-            office_rows = df[
-                (df["item_id"] == item_id) &
-                (df["location"] == SOURCE_LOCATION)
-            ]
-
-            if not office_rows.empty:
-                latest_office = (
-                    office_rows
-                    .sort_values("timestamp")
-                    .iloc[-1]
-                )
-                model = latest_office["model"]
-                substance = latest_office["substance"]
-            else:
-                model = "-"
-                substance = "-"
-
-        # ==================================================
-        # WRITE ROW
-        # ==================================================
-        row = {
+
+def log_movements(
+    items: list,
+    location: str,
+    model: str = "-",
+    substance: str = "-",
+):
+    # Bulk variant of log_movement: items is a list of
+    # {"item_id": ..., "status": ...} dicts, all committed in one write.
+    for item in items:
+        parse_item_id(item["item_id"])
+    quantities = [parse_quantity(item["status"]) for item in items]
+    timestamp = _now()
+
+    rows = [
+        {
             "timestamp": timestamp,
-            "item_id": item_id,
+            "item_id": item["item_id"],
             "location": location,
-            "status": status,
+            "status": quantity,
             "model": model,
             "substance": substance,
         }
+        for item, quantity in zip(items, quantities)
+    ]
 
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-        df.to_csv(TRACE_LOG, index=False)
-
-    return row
+    if not rows:
+        return []
+    return _submit(rows)